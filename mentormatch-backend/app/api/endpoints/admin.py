@@ -12,10 +12,16 @@ from typing import Optional
 
 from app.core.database import get_db
 from app.core.monitor import monitor
+from app.core.jail import jail
+from app.core.client_ip import normalize_ip
+from app.core.monitor_writer import monitor_writer
+from app.services.chatvat import chatvat_service
+from app.services.chat_writer import chat_writer
+from app.middleware.prompt_guard import scanner_stats
 from app.models.chat import ChatSession, ChatMessage, Feedback, AdminUser, SecurityEvent, PageVisit
 from app.schemas.admin import (
     SuperAdminDashboard, DBQueryResponse, DBQueryRequest,
-    LoginRequest, LoginResponse, FeedbackItem, FeedbackListResponse
+    LoginRequest, LoginResponse, FeedbackItem, FeedbackListResponse, IPBanRequest
 )
 # Import the hierarchy checks
 from app.core.security import (
@@ -144,7 +150,7 @@ def get_dashboard(
 
     # Security counters from persisted DB table (survives restarts)
     sec_counts = dict(
-        db.query(SecurityEvent.event_type, func.count())
+        db.query(SecurityEvent.event_type, func.sum(SecurityEvent.event_count))
         .group_by(SecurityEvent.event_type)
         .all()
     )
@@ -156,14 +162,17 @@ def get_dashboard(
     # Recent security logs — prefer DB (persisted) over in-memory
     recent_logs_rows = (
         db.query(SecurityEvent)
-        .order_by(SecurityEvent.created_at.desc())
+        .order_by(func.coalesce(SecurityEvent.last_seen_at, SecurityEvent.created_at).desc())
         .limit(5)
         .all()
     )
-    recent_logs = [
-        f"[{r.created_at.strftime('%H:%M:%S') if r.created_at else '??'}] [{r.event_type}] {r.detail or ''}"
-        for r in recent_logs_rows
-    ]
+    recent_logs = []
+    for r in recent_logs_rows:
+        seen = r.last_seen_at or r.created_at
+        repeats = f" (x{r.event_count})" if r.event_count and r.event_count > 1 else ""
+        recent_logs.append(f"[{seen.strftime('%H:%M:%S') if seen else '??'}] [{r.event_type}] {r.detail or ''}{repeats}")
+
+    latency = monitor.get_latency_summary(window_minutes=5)
 
     return {
         "timestamp": datetime.now(),
@@ -172,9 +181,12 @@ def get_dashboard(
             "total_gateway_requests": monitor.total_requests,
             "total_sessions": total_sessions,
             "total_visits": total_visits,
-            "requests_per_minute_peak": 0,
+            "requests_per_minute_peak": monitor.get_requests_per_minute_peak(window_minutes=60),
             "average_latency_ms": monitor.get_avg_latency(),
-            "total_tokens_processed": total_chat_queries * 100
+            "total_tokens_processed": total_chat_queries * 100,
+            "latency_p50_ms": latency["p50_ms"],
+            "latency_p95_ms": latency["p95_ms"],
+            "latency_p99_ms": latency["p99_ms"],
         },
         "security": {
             "total_blocks": rl + pi + sq,
@@ -182,7 +194,7 @@ def get_dashboard(
             "prompt_injection_attempts": pi,
             "sqli_attempts": sq,
             "banned_topic_hits": bt,
-            "blocked_ips_count": 0
+            "blocked_ips_count": jail.banned_count()
         },
         "system": {
             "cpu_usage_percent": cpu,
@@ -190,9 +202,9 @@ def get_dashboard(
             "ram_total_gb": ram_total_gb,
             "ram_used_gb": ram_used_gb,
             "db_connection_status": True,
-            "chatvat_engine_status": True,
+            "chatvat_engine_status": chatvat_service.is_available(),
             "uptime_seconds": monitor.get_uptime(),
-            "error_rate_5xx": 0.0,
+            "error_rate_5xx": latency["error_rate_5xx"],
             "storage": storage,
             "load_average": load_avg,
             "top_processes": top_procs,
@@ -205,6 +217,7 @@ def get_dashboard(
             "net_promoter_score": 0.0,
             "unresolved_feedback": unresolved
         },
+        "caches": monitor.get_cache_stats(),
         "recent_security_logs": recent_logs if recent_logs else monitor.security_logs[:5]
     }
 
@@ -254,6 +267,35 @@ def get_traffic_history(
     return {"hours": hours, "series": series}
 
 
+@router.get("/traffic/latency")
+def get_latency_breakdown(
+    window_minutes: int = Query(5, description="Rolling window: 1, 5 or 60 minutes"),
+    user: AdminUser = Depends(require_viewer),
+):
+    """p50/p95/p99 per route and status class, plus the overall summary."""
+    if window_minutes not in (1, 5, 60):
+        raise HTTPException(status_code=400, detail="window_minutes must be 1, 5 or 60")
+    return {
+        "window_minutes": window_minutes,
+        "overall": monitor.get_latency_summary(window_minutes),
+        "routes": monitor.get_route_latency(window_minutes),
+    }
+
+@router.get("/chatvat/backends")
+def get_chatvat_backends(user: AdminUser = Depends(require_viewer)):
+    """Per-replica ChatVat health (breaker state, in-flight calls, errors, average latency)
+    plus the admission queue in front of them."""
+    return {
+        "backends": chatvat_service.backend_stats(),
+        "dispatcher": chatvat_service.dispatcher_stats(),
+    }
+
+@router.get("/prompt-guard/stats")
+def get_prompt_guard_stats(user: AdminUser = Depends(require_viewer)):
+    """Scanner pool health: pending/queued batches and per-model inference latency."""
+    return scanner_stats()
+
+
 # ==========================================
 # LEVEL 2: EDITOR (List & Resolve Feedback)
 # ==========================================
@@ -371,6 +413,39 @@ def revoke_user(
     db.commit()
     return {"status": "success", "message": f"Revoked access for {target.email}"}
 
+@router.get("/security/writer")
+def get_security_writer_stats(user: AdminUser = Depends(require_viewer)):
+    """Background writers: the security-event writer (queue depth, rows written, events
+    dropped under floods) and, under "chat_write_behind", the chat write-behind queue."""
+    return {**monitor_writer.stats(), "chat_write_behind": chat_writer.stats()}
+
+# --- IP JAIL ---
+@router.get("/jail")
+def list_banned_ips(user: AdminUser = Depends(require_viewer)):  # Viewer+
+    """IPs currently jailed, newest ban first."""
+    return {"banned": jail.banned()}
+
+@router.post("/jail/ban")
+def ban_ip(request: IPBanRequest, user: AdminUser = Depends(require_admin)):  # Admin+
+    if request.duration_seconds <= 0:
+        raise HTTPException(status_code=400, detail="duration_seconds must be positive")
+    jail.ban(request.ip, request.duration_seconds)
+    monitor.log_security_event(
+        "IP_BANNED", f"IP {request.ip} banned for {request.duration_seconds}s by {user.email}", client_ip=request.ip
+    )
+    return {"status": "success", "message": f"Banned {request.ip} for {request.duration_seconds}s"}
+
+@router.post("/jail/{ip}/unban")
+def unban_ip(ip: str, user: AdminUser = Depends(require_admin)):  # Admin+
+    try:
+        ip = normalize_ip(ip)  # Same key as the ban, however the address is written
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Not a valid IP address")
+    if not jail.unban(ip):
+        raise HTTPException(status_code=404, detail="IP is not banned")
+    monitor.log_security_event("IP_UNBANNED", f"IP {ip} unbanned by {user.email}", client_ip=ip)
+    return {"status": "success", "message": f"Unbanned {ip}"}
+
 # ==========================================
 # LEVEL 4: SUPER ADMIN (Run SQL)
 # ==========================================
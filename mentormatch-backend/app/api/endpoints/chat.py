@@ -1,57 +1,153 @@
 # FILE: app/api/endpoints/chat.py
 
+import json
+import uuid
+import asyncio
+import httpx
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import get_db, SessionLocal
 from app.schemas.chat import ChatRequest, ChatResponse, FeedbackCreate
 from app.models.chat import ChatSession, ChatMessage, Feedback, PageVisit
 from app.services.chatvat import chatvat_service
+from app.services.chat_writer import chat_writer
 from app.middleware.prompt_guard import scan_prompt
 from app.core.security import verify_turnstile
+from app.core.client_ip import get_client_ip
+from app.core.config import settings
+from app.core.monitor import monitor
+from app.core.deadline import Deadline
 
 router = APIRouter()
 
-@router.post("/chat", response_model=ChatResponse)
-def chat_endpoint(request: ChatRequest, raw_request: Request, db: Session = Depends(get_db)):
+def _create_session(db: Session, client_ip: str):
+    new_session = ChatSession(client_ip=client_ip)
+    db.add(new_session)
+    db.commit()
+    db.refresh(new_session)
+    return new_session.id
+
+def _session_exists(db: Session, session_id) -> bool:
+    return db.query(ChatSession).filter(ChatSession.id == session_id).first() is not None
+
+def _message_rows(session_id, user_text: str, ai_text: str) -> list:
+    """Rows for one user/assistant turn, for the write-behind queue.
+
+    Timestamps are set here rather than by Postgres so the pair keeps its
+    order (and its real time) no matter when the batch is flushed.
+    """
+    now = datetime.now(timezone.utc)
+    return [
+        {"session_id": session_id, "role": "user", "content": user_text, "created_at": now},
+        {"session_id": session_id, "role": "assistant", "content": ai_text,
+         "created_at": now + timedelta(microseconds=1)},
+    ]
+
+async def _open_session(db: Session, client_ip: str):
+    """Create a chat session — queued (write-behind) when possible, else committed now."""
+    if settings.CHAT_WRITE_BEHIND_ENABLED:
+        session_id = uuid.uuid4()
+        if chat_writer.enqueue_session(session_id, client_ip):
+            return session_id
+    return await run_in_threadpool(_create_session, db, client_ip)
+
+async def _persist_turn(db: Optional[Session], session_id, user_text: str, ai_text: str):
+    """Store a user/assistant pair — queued (write-behind) when possible, else committed now.
+
+    `db=None` uses a fresh DB session (for callers outliving the request's session).
+    """
+    if settings.CHAT_WRITE_BEHIND_ENABLED:
+        rows = _message_rows(session_id, user_text, ai_text)
+        if chat_writer.enqueue_messages(rows):
+            return
+        if chat_writer.is_pending_session(session_id):
+            # Queue full, but the session row is still queued too — a direct
+            # insert would fail its foreign key, so wait for room instead.
+            await chat_writer.put_messages(rows)
+            return
+    if db is None:
+        await run_in_threadpool(_save_messages_detached, session_id, user_text, ai_text)
+    else:
+        await run_in_threadpool(_save_messages, db, session_id, user_text, ai_text)
+
+def _save_messages(db: Session, session_id, user_text: str, ai_text: str):
+    user_msg = ChatMessage(session_id=session_id, role="user", content=user_text)
+    ai_msg = ChatMessage(session_id=session_id, role="assistant", content=ai_text)
+    db.add(user_msg)
+    db.add(ai_msg)
+    db.commit()
+    db.refresh(ai_msg)
+
+def _save_messages_detached(session_id, user_text: str, ai_text: str):
+    """Same as _save_messages, on a fresh DB session.
+
+    Used by the streaming endpoint: the request-scoped session may already be
+    closed by the time the stream finishes.
+    """
+    db = SessionLocal()
+    try:
+        _save_messages(db, session_id, user_text, ai_text)
+    finally:
+        db.close()
+
+async def _prepare_chat(request: ChatRequest, raw_request: Request, db: Session, deadline: Deadline):
+    """Steps shared by /chat and /chat/stream: human check, prompt scan, session lookup."""
     # 0. VERIFY HUMAN — session-gated (first message only)
     # Turnstile tokens are single-use. Verify on new sessions only;
     # subsequent messages reuse the already-verified session.
     if not request.session_id:
         if not request.turnstile_token:
             raise HTTPException(status_code=400, detail="Verifying if you are a human. Pease send request after few seconds.")
-        verify_turnstile(request.turnstile_token)
+        deadline.check("Turnstile")
+        await run_in_threadpool(verify_turnstile, request.turnstile_token, deadline.timeout(5))
     
     # 1. SECURITY: Scan the prompt
-    safe_text = scan_prompt(request.message)
+    # The models can't be interrupted, but the client stops waiting for them.
+    deadline.check("prompt scan")
+    client_ip = get_client_ip(raw_request)
+    try:
+        # Jail strikes key on the same client IP as the rate limiter
+        safe_text = await asyncio.wait_for(scan_prompt(request.message, client_ip), deadline.remaining())
+    except asyncio.TimeoutError:
+        raise deadline.exceeded("prompt scan")
 
     # 2. SESSION MANAGEMENT
     if not request.session_id:
-        # Extract real client IP from reverse proxy header
-        client_ip = raw_request.headers.get("x-forwarded-for", raw_request.client.host if raw_request.client else "unknown")
-        if "," in client_ip:
-            client_ip = client_ip.split(",")[0].strip()
-        new_session = ChatSession(client_ip=client_ip) 
-        db.add(new_session)
-        db.commit()
-        db.refresh(new_session)
-        session_id = new_session.id
+        session_id = await _open_session(db, client_ip)
+        chatvat_service.start_history(session_id)
     else:
-        session = db.query(ChatSession).filter(ChatSession.id == request.session_id).first()
-        if not session:
+        # A session with cached history is known to exist — skip the lookup
+        # (or one still waiting in the write-behind queue).
+        if not chatvat_service.knows_session(request.session_id) and \
+                not chat_writer.is_pending_session(request.session_id) and \
+                not await run_in_threadpool(_session_exists, db, request.session_id):
             raise HTTPException(status_code=404, detail="Session not found")
         session_id = request.session_id
 
+    return safe_text, session_id, client_ip
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat_endpoint(request: ChatRequest, raw_request: Request, db: Session = Depends(get_db)):
+    # Async so the (slow) ChatVat call doesn't pin a threadpool thread.
+    # Blocking work (Turnstile HTTP, ML scanners, SQLAlchemy) is pushed to
+    # the threadpool explicitly so the event loop is never stalled.
+    # One end-to-end budget, consumed by every stage below
+    deadline = Deadline(settings.CHAT_REQUEST_DEADLINE_SECONDS)
+    safe_text, session_id, client_ip = await _prepare_chat(request, raw_request, db, deadline)
+
     # 3. GET AI RESPONSE (before saving user msg, so history query
     #    only sees truly *previous* messages — no duplication)
-    ai_text = chatvat_service.ask(safe_text, session_id, db)
+    # Admission is fair across IPs, then across the sessions behind each IP
+    client_key = (client_ip, str(session_id))
+    ai_text = await chatvat_service.ask(safe_text, session_id, db, client_key=client_key, deadline=deadline)
 
     # 4. SAVE BOTH MESSAGES (user + assistant) together
-    user_msg = ChatMessage(session_id=session_id, role="user", content=safe_text)
-    ai_msg = ChatMessage(session_id=session_id, role="assistant", content=ai_text)
-    db.add(user_msg)
-    db.add(ai_msg)
-    db.commit()
-    db.refresh(ai_msg)
+    await _persist_turn(db, session_id, safe_text, ai_text)
+    chatvat_service.remember_turn(session_id, safe_text, ai_text)
 
     # Passthrough: return ChatVat's plain text message + session tracking
     return ChatResponse(
@@ -59,6 +155,67 @@ def chat_endpoint(request: ChatRequest, raw_request: Request, db: Session = Depe
         message=ai_text
     )
 
+def _sse(data: dict, event: str = None) -> str:
+    """Format one Server-Sent Event frame."""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, raw_request: Request, db: Session = Depends(get_db)):
+    """Streaming variant of /chat — forwards ChatVat chunks as Server-Sent Events.
+
+    Event sequence:
+      event: session  data: {"session_id": "..."}
+      data: {"delta": "..."}            (repeated, one per upstream chunk)
+      event: done     data: {"session_id": "...", "message": "<full reply>"}
+    or, if ChatVat fails mid-way:
+      event: error    data: {"message": "..."}
+
+    Validation errors (Turnstile, prompt guard, unknown session) still come
+    back as regular JSON errors because they happen before the stream opens.
+    """
+    deadline = Deadline(settings.CHAT_REQUEST_DEADLINE_SECONDS)
+    safe_text, session_id, client_ip = await _prepare_chat(request, raw_request, db, deadline)
+
+    # Fail fast (plain 503) before the stream opens if ChatVat is known down
+    chatvat_service.ensure_available()
+
+    # History is read now, while the request-scoped DB session is still open.
+    payload = await chatvat_service.build_payload(safe_text, session_id, db, deadline)
+    client_key = (client_ip, str(session_id))
+
+    async def event_stream():
+        yield _sse({"session_id": str(session_id)}, event="session")
+
+        chunks = []
+        try:
+            async for chunk in chatvat_service.ask_stream(payload, safe_text, client_key, deadline):
+                chunks.append(chunk)
+                yield _sse({"delta": chunk})
+        except (httpx.HTTPError, HTTPException):
+            yield _sse({"message": "Our AI mentor is currently napping. Please try again in 2 minutes."}, event="error")
+            return
+        except Exception as e:
+            # Headers are already sent: anything else must still end in an error frame
+            monitor.log_security_event("SYSTEM_ERROR", f"Chat stream failed: {e}")
+            yield _sse({"message": "Something went wrong while answering. Please try again."}, event="error")
+            return
+
+        # Persist the assembled reply once the stream has ended
+        ai_text = "".join(chunks)
+        await _persist_turn(None, session_id, safe_text, ai_text)
+        chatvat_service.remember_turn(session_id, safe_text, ai_text)
+        yield _sse({"session_id": str(session_id), "message": ai_text}, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Tell Nginx not to buffer the stream
+        },
+    )
+
 @router.post("/feedback")
 def submit_feedback(feedback: FeedbackCreate, db: Session = Depends(get_db)):
     # Verify Turnstile if token was provided
@@ -82,7 +239,7 @@ def submit_feedback(feedback: FeedbackCreate, db: Session = Depends(get_db)):
 @router.post("/visit")
 def record_visit(request: Request, db: Session = Depends(get_db)):
     """Record a real human page visit (called once per browser session by the frontend)."""
-    client_ip = request.headers.get("x-forwarded-for", request.client.host if request.client else "unknown")
+    client_ip = get_client_ip(request)
     user_agent = request.headers.get("user-agent", "")
     visit = PageVisit(client_ip=client_ip, user_agent=user_agent, path="/")
     db.add(visit)
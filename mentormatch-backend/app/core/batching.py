@@ -0,0 +1,150 @@
+# FILE: app/core/batching.py
+
+import time
+import asyncio
+import threading
+from concurrent.futures import Executor
+from typing import Callable, List, Optional
+from starlette.concurrency import run_in_threadpool
+
+
+class MicroBatcher:
+    """Collects concurrent single-item requests into one batched call.
+
+    Callers `await submit(item)`. Items are buffered until either
+    `max_batch_size` are waiting or `max_wait_ms` has passed since the first
+    one arrived; then `run_batch(items) -> results` (blocking, same order)
+    runs once in a worker thread and each caller gets its own result back.
+    Pass `executor` to run batches on a dedicated pool instead of the shared
+    AnyIO threadpool, and `max_in_flight` to cap how many of this batcher's
+    batches run at once (1 for a model that isn't thread-safe) — items that
+    arrive meanwhile wait and go out together when a batch finishes.
+
+    Lives on the event loop, so the buffer needs no locking.
+    """
+
+    def __init__(self, name: str, run_batch: Callable[[List], List], max_batch_size: int, max_wait_ms: float,
+                 executor: Optional[Executor] = None, max_in_flight: Optional[int] = None):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_ms / 1000
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+
+        self._pending: list = []      # [(item, future)]
+        self._in_flight = 0           # batches started and not finished
+        self._timer = None
+        self._tasks: set = set()      # keep flush tasks referenced until done
+
+        # Stats (event loop only, except _queued/_running which the worker
+        # also moves — those change under _stats_lock)
+        self._stats_lock = threading.Lock()
+        self._queued = 0              # batches handed to the pool, not started yet
+        self._running = 0
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._total_ms = 0.0
+        self._max_ms = 0.0
+        self._last_ms = 0.0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((item, fut))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_seconds, self._flush)
+
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            if self.max_in_flight is not None and self._in_flight >= self.max_in_flight:
+                return  # picked up again when a running batch finishes
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            self._in_flight += 1
+            task = asyncio.get_running_loop().create_task(self._execute(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, batch: list):
+        try:
+            results = await self._call([item for item, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            self._in_flight -= 1
+            if self._pending:
+                self._flush()
+
+        for (_, fut), result in zip(batch, results):
+            if not fut.done():  # caller may have given up (deadline / disconnect)
+                fut.set_result(result)
+
+    async def _call(self, items: list) -> list:
+        # "queued" -> "running" (worker picked it up) -> "done"; whichever side
+        # moves it on adjusts the counters, so a batch that never started
+        # (pool shut down, submit failed, task cancelled) can't skew them.
+        state = {"phase": "queued"}
+        with self._stats_lock:
+            self._queued += 1
+        try:
+            if self.executor is None:
+                elapsed_ms, results = await run_in_threadpool(self._timed, items, state)
+            else:
+                loop = asyncio.get_running_loop()
+                elapsed_ms, results = await loop.run_in_executor(self.executor, self._timed, items, state)
+        except Exception:
+            self._errors += 1
+            raise
+        finally:
+            with self._stats_lock:
+                if state["phase"] == "queued":
+                    self._queued -= 1
+                elif state["phase"] == "running":
+                    self._running -= 1
+                state["phase"] = "done"
+
+        self._batches += 1
+        self._items += len(items)
+        self._total_ms += elapsed_ms
+        self._last_ms = elapsed_ms
+        self._max_ms = max(self._max_ms, elapsed_ms)
+        return results
+
+    def _timed(self, items: list, state: dict):
+        # Runs on the worker: queue wait ends here, model time starts
+        with self._stats_lock:
+            if state["phase"] == "queued":
+                state["phase"] = "running"
+                self._queued -= 1
+                self._running += 1
+        start = time.perf_counter()
+        results = self.run_batch(items)
+        return (time.perf_counter() - start) * 1000, results
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "pending_items": len(self._pending),
+            "queued_batches": self._queued,
+            "running_batches": self._running,
+            "batches": self._batches,
+            "items": self._items,
+            "errors": self._errors,
+            "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0,
+            "avg_latency_ms": round(self._total_ms / self._batches, 2) if self._batches else 0,
+            "last_latency_ms": round(self._last_ms, 2),
+            "max_latency_ms": round(self._max_ms, 2),
+        }
@@ -0,0 +1,58 @@
+# FILE: app/core/client_ip.py
+
+import ipaddress
+from functools import lru_cache
+from starlette.requests import HTTPConnection
+from app.core.config import settings
+
+
+@lru_cache(maxsize=4)
+def _trusted_networks(spec: str) -> tuple:
+    return tuple(ipaddress.ip_network(part.strip(), strict=False) for part in spec.split(",") if part.strip())
+
+def normalize_ip(value: str) -> str:
+    """Canonical text form of an IP address, so one client is one jail / rate-limit key.
+
+    "2001:DB8::0001" and "2001:db8::1" are the same address, and so are an
+    IPv4-mapped "::ffff:203.0.113.7" and "203.0.113.7". Raises ValueError if
+    `value` is not an IP address.
+    """
+    address = ipaddress.ip_address(value.strip())
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return str(address)
+
+def _is_trusted(ip: str) -> bool:
+    address = ipaddress.ip_address(ip)
+    return any(address in network for network in _trusted_networks(settings.TRUSTED_PROXIES))
+
+def get_client_ip(request: HTTPConnection) -> str:
+    """The real client address, for rate limits, jail strikes and logging.
+
+    X-Forwarded-For is only believed when the socket peer is one of
+    TRUSTED_PROXIES (our Nginx), and is read right to left: trusted hops are
+    skipped and the first other address is the client. Entries further left
+    were written by the client itself, so a forged header can't borrow
+    someone else's IP — and the proxy's own address never gets jailed.
+    Addresses are returned in canonical form (`normalize_ip`).
+    """
+    peer = request.client.host if request.client else None
+    if not peer:
+        return "unknown"
+    try:
+        peer = normalize_ip(peer)
+    except ValueError:
+        return peer  # not an IP (e.g. a test client): never a trusted proxy
+    if not _is_trusted(peer):
+        return peer
+
+    client = peer
+    for hop in reversed(request.headers.get("x-forwarded-for", "").split(",")):
+        try:
+            hop = normalize_ip(hop)
+        except ValueError:
+            break  # garbage from the client side: stop at the last good hop
+        client = hop
+        if not _is_trusted(hop):
+            break
+    return client
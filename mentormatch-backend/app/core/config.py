@@ -31,6 +31,11 @@ class Settings(BaseSettings):
     def DATABASE_URL(self) -> str:
         return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.DATABASE_HOST}:{self.DATABASE_PORT}/{self.POSTGRES_DB}"
 
+    # --- REVERSE PROXY ---
+    # Peers whose X-Forwarded-For is believed (comma-separated IPs / CIDRs).
+    # Defaults cover Nginx on the host reaching the container over the Docker bridge.
+    TRUSTED_PROXIES: str = "127.0.0.1,::1,172.16.0.0/12"
+
     # --- CORS ---
     CORS_ORIGINS: str = "http://localhost:3000,http://127.0.0.1:3000"
 
@@ -38,6 +43,61 @@ class Settings(BaseSettings):
     TURNSTILE_SITE_KEY: str = ""
     TURNSTILE_SECRET_KEY: str = "1x0000000000000000000000000000000AA"
 
+    # --- REQUEST DEADLINES ---
+    # Overall budget for one /chat call (Turnstile + prompt scan + history +
+    # every ChatVat attempt). Stages are skipped/shortened to stay inside it.
+    CHAT_REQUEST_DEADLINE_SECONDS: float = 60.0
+    # A ChatVat retry is only attempted if at least this much budget is left
+    CHATVAT_RETRY_MIN_REMAINING_SECONDS: float = 3.0
+
+    # --- SHARED STATE (rate limits + monitor counters) ---
+    # "memory" = per process; "sqlite" = one tmpfs SQLite file shared by all uvicorn workers
+    SHARED_STATE_BACKEND: str = "memory"
+    SHARED_STATE_PATH: str = "/dev/shm/mentormatch-state.db"
+
+    # --- SECURITY EVENT WRITER (batched background persistence) ---
+    SECURITY_EVENT_FLUSH_MS: int = 500
+    SECURITY_EVENT_BATCH_ROWS: int = 500
+    SECURITY_EVENT_MAX_QUEUE: int = 10000  # events beyond this are dropped (and counted) under floods
+    # Fold repeats of the same (event_type, client_ip) within this window into one row (0 = one row per event)
+    SECURITY_EVENT_AGGREGATE_WINDOW_SECONDS: int = 60
+
+    # --- IP JAIL ---
+    # Strike points (RATE_LIMIT 1, PROMPT_INJECTION 3, SQLI 5) within the window earn a ban;
+    # each repeat ban doubles, up to the max. Clean for LEVEL_MEMORY -> back to the base ban.
+    JAIL_ENABLED: bool = True
+    JAIL_STRIKE_THRESHOLD: int = 10
+    JAIL_STRIKE_WINDOW_SECONDS: int = 600
+    JAIL_BASE_BAN_SECONDS: int = 300
+    JAIL_MAX_BAN_SECONDS: int = 86400
+    JAIL_LEVEL_MEMORY_SECONDS: int = 86400
+
+    # --- PROMPT GUARD (LLM-Guard scanners) ---
+    # Micro-batching: prompts arriving within the window share one forward pass
+    PROMPT_GUARD_BATCH_MAX_SIZE: int = 16
+    PROMPT_GUARD_BATCH_MAX_WAIT_MS: float = 5.0
+    # Dedicated inference threads (one per model lets both run at once; each
+    # model runs one batch at a time, so more than 2 adds nothing)
+    PROMPT_GUARD_WORKERS: int = 2
+    # Torch intra-op threads per process; 0 = auto (CPU cores / PROMPT_GUARD_WORKERS,
+    # so parallel models don't oversubscribe the cores), -1 leaves torch's default
+    PROMPT_GUARD_TORCH_THREADS: int = 0
+    # ONNX Runtime backend (needs llm-guard[onnxruntime]); optional dynamic int8 quantization
+    PROMPT_GUARD_USE_ONNX: bool = False
+    PROMPT_GUARD_ONNX_QUANTIZE: bool = False
+    PROMPT_GUARD_ONNX_CACHE_DIR: str = "/tmp/prompt-guard-onnx"
+    # Lexical pre-filter tier: clears small talk / blocks textbook injections without the models.
+    # SHADOW_RATE = fraction of pre-filter passes re-checked by the models to measure false negatives.
+    PROMPT_GUARD_PREFILTER_ENABLED: bool = True
+    PROMPT_GUARD_PREFILTER_SHADOW_RATE: float = 0.05
+    # Long prompts are scanned as overlapping windows (~512 model tokens each)
+    PROMPT_GUARD_WINDOW_CHARS: int = 1500
+    PROMPT_GUARD_WINDOW_OVERLAP_CHARS: int = 200
+    # Verdict cache: identical prompts skip inference (hits/misses in the monitor's cache stats)
+    PROMPT_GUARD_CACHE_ENABLED: bool = True
+    PROMPT_GUARD_CACHE_MAX_ENTRIES: int = 10000
+    PROMPT_GUARD_CACHE_TTL_SECONDS: int = 3600
+
     # --- CHATVAT ---
     CHATVAT_HOST: str = "172.17.0.1"
     CHATVAT_PORT: str = "8000"
@@ -46,6 +106,61 @@ class Settings(BaseSettings):
     def CHATVAT_ENGINE_URL(self) -> str:
         return f"http://{self.CHATVAT_HOST}:{self.CHATVAT_PORT}"
 
+    # Several ChatVat replicas (comma-separated base URLs, e.g.
+    # "http://10.0.0.5:8000,http://10.0.0.6:8000"). Empty → CHATVAT_ENGINE_URL only.
+    CHATVAT_ENDPOINTS: str = ""
+
+    @property
+    def CHATVAT_ENGINE_URLS(self) -> list:
+        urls = [u.strip() for u in self.CHATVAT_ENDPOINTS.split(",") if u.strip()]
+        return urls or [self.CHATVAT_ENGINE_URL]
+
+    # Resilience: circuit breaker (per replica) + jittered retries
+    CHATVAT_BREAKER_FAILURE_THRESHOLD: int = 5      # Consecutive failures before ejecting
+    CHATVAT_BREAKER_RESET_SECONDS: float = 30.0     # Open → half-open probe delay
+    CHATVAT_RETRY_ATTEMPTS: int = 1                 # Extra attempts after the first
+    CHATVAT_RETRY_BASE_DELAY_SECONDS: float = 0.5
+    CHATVAT_RETRY_MAX_DELAY_SECONDS: float = 4.0
+    CHATVAT_RETRY_BUDGET_RATIO: float = 0.2         # Retries allowed per request, long-run
+
+    # Admission queue in front of ChatVat (fair per client)
+    CHATVAT_MAX_CONCURRENCY: int = 32          # Upstream calls in flight at once
+    CHATVAT_MAX_QUEUE: int = 256               # Waiting callers before instant 503
+    CHATVAT_QUEUE_TIMEOUT_SECONDS: float = 10.0  # Max wait for a slot before 503
+
+    # Answer cache for history-less (first-turn) questions — off by default
+    CHATVAT_CACHE_ENABLED: bool = False
+    CHATVAT_CACHE_MAX_ENTRIES: int = 1024
+    CHATVAT_CACHE_TTL_SECONDS: int = 60 * 60  # 1 hour
+
+    # Per-session history cache (last few messages, in-process) — off by default.
+    # Each uvicorn worker has its own copy, so it is only correct with a single
+    # worker (or sticky sessions); it is ignored when SHARED_STATE_BACKEND says
+    # several workers are running.
+    CHAT_HISTORY_CACHE_ENABLED: bool = False
+    CHAT_HISTORY_CACHE_SESSIONS: int = 4096
+    CHAT_HISTORY_CACHE_TTL_SECONDS: int = 30 * 60  # 30 min idle
+
+    # Write-behind persistence for chat sessions/messages — off by default.
+    # Rows are queued and bulk-inserted by a background task; the response
+    # no longer waits for Postgres. Queued rows are flushed on shutdown.
+    # Single uvicorn worker only; ignored when SHARED_STATE_BACKEND says
+    # several workers are running.
+    CHAT_WRITE_BEHIND_ENABLED: bool = False
+    CHAT_WRITE_BEHIND_FLUSH_MS: int = 200
+    CHAT_WRITE_BEHIND_BATCH_ROWS: int = 200
+    CHAT_WRITE_BEHIND_MAX_QUEUE: int = 5000   # Full queue → synchronous write fallback
+
+    # Streaming endpoint on the ChatVat engine (SSE or chunked text)
+    CHATVAT_STREAM_PATH: str = "/chat/stream"
+
+    # Async HTTP client (persistent keep-alive pool to the ChatVat engine)
+    CHATVAT_TIMEOUT_SECONDS: float = 45.0
+    CHATVAT_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    CHATVAT_MAX_CONNECTIONS: int = 200           # Hard cap on in-flight upstream calls
+    CHATVAT_MAX_KEEPALIVE_CONNECTIONS: int = 50  # Idle sockets kept warm for reuse
+    CHATVAT_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+
     class Config:
         # Tells Pydantic to read the .env file
         env_file = ".env"
@@ -15,7 +15,43 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # All database models will inherit from this.
 Base = declarative_base()
 
-# 4. Dependency Injection
+# 4. In-place schema upgrades
+# create_all() only creates missing tables; columns added to existing tables
+# are added here (idempotent, safe to run on every boot). Several workers
+# boot at once, so on Postgres the upgrade runs under a transaction-scoped
+# advisory lock and every statement is IF NOT EXISTS.
+_ADDED_COLUMNS = {
+    "security_events": [
+        ("event_count", "INTEGER NOT NULL DEFAULT 1"),
+        ("first_seen_at", "TIMESTAMP WITH TIME ZONE"),
+        ("last_seen_at", "TIMESTAMP WITH TIME ZONE"),
+    ],
+}
+_ADDED_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_security_events_last_seen_at ON security_events (last_seen_at)",
+]
+_SCHEMA_LOCK_ID = 7_310_025  # Arbitrary, app-wide key for pg_advisory_xact_lock
+
+def upgrade_schema():
+    from sqlalchemy import inspect, text
+    with engine.begin() as conn:
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            # Held until commit: the next worker sees the finished upgrade
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _SCHEMA_LOCK_ID})
+        # SQLite has no ADD COLUMN IF NOT EXISTS; the inspector check covers it
+        if_not_exists = "IF NOT EXISTS " if postgres else ""
+        inspector = inspect(conn)
+        for table, columns in _ADDED_COLUMNS.items():
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            for name, ddl in columns:
+                if name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {if_not_exists}{name} {ddl}"))
+                    print(f"[DB] Added column {table}.{name}")
+        for ddl in _ADDED_INDEXES:
+            conn.execute(text(ddl))
+
+# 5. Dependency Injection
 # Opens a connection for a request and closes it safely afterwards.
 def get_db():
     db = SessionLocal()
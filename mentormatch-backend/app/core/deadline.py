@@ -0,0 +1,48 @@
+# FILE: app/core/deadline.py
+
+import time
+from typing import Optional
+from fastapi import HTTPException
+
+
+class Deadline:
+    """End-to-end time budget for one request.
+
+    Created once at the start of the handler and handed to every stage
+    (Turnstile, prompt scan, history fetch, ChatVat attempts). Each stage
+    checks it before starting and caps its own timeout to what is left, so
+    the client gets a bounded worst-case latency and retries are skipped
+    when there is no time for them.
+    """
+
+    def __init__(self, seconds: float):
+        self.budget_seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: float) -> float:
+        """A stage's own timeout, shortened to the remaining budget."""
+        return min(cap, self.remaining())
+
+    def check(self, stage: str):
+        """Raise 504 if the budget is already spent before `stage` starts."""
+        if self.expired:
+            raise self.exceeded(stage)
+
+    def exceeded(self, stage: str) -> HTTPException:
+        print(f"[DEADLINE] {self.budget_seconds:g}s budget exhausted at stage: {stage}")
+        return HTTPException(
+            status_code=504,
+            detail="Our AI mentor took too long to respond. Please try again.",
+        )
+
+
+def remaining_or(deadline: Optional[Deadline], default: float) -> float:
+    """`default` capped by the deadline, or just `default` when there is none."""
+    return deadline.timeout(default) if deadline is not None else default
@@ -0,0 +1,125 @@
+# FILE: app/core/jail.py
+
+import time
+import threading
+from typing import Callable, Optional
+from app.core.config import settings
+from app.core.shared_state import shared_state
+
+# Offence weights: points an IP collects per security event. Reaching
+# JAIL_STRIKE_THRESHOLD points within JAIL_STRIKE_WINDOW_SECONDS earns a ban.
+OFFENCE_WEIGHTS = {
+    "RATE_LIMIT": 1,
+    "OVERSIZED_PAYLOAD": 1,   # often just a long paste, not an attack
+    "PROMPT_INJECTION": 3,
+    "SQLI": 5,
+}
+
+_STRIKES = "jail:strikes:"
+_LEVEL = "jail:level:"
+_BAN = "jail:ban:"   # value = ban expiry (unix time); the key expires with it
+
+
+class IPJail:
+    """Time-boxed IP bans with exponential escalation.
+
+    Each ban doubles the next one (JAIL_BASE_BAN_SECONDS, 2x, 4x, ... capped at
+    JAIL_MAX_BAN_SECONDS); an IP that stays clean for JAIL_LEVEL_MEMORY_SECONDS
+    starts over at the base ban. State lives in the shared-state backend, so a
+    ban applies on every worker.
+    """
+
+    def __init__(self):
+        # Strike points waiting for the worker thread (queue_offence)
+        self._pending: dict = {}      # ip -> points
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._on_ban: Optional[Callable[[str, int], None]] = None
+
+    def is_banned(self, ip: str) -> float:
+        """Seconds left on the ban for `ip` (0 if not banned)."""
+        until = shared_state.get(_BAN + ip)
+        return max(0.0, until - time.time()) if until else 0.0
+
+    def record_offence(self, event_type: str, ip: Optional[str]) -> Optional[int]:
+        """Add the event's strike points for `ip`. Returns the ban length if this offence earned one."""
+        weight = OFFENCE_WEIGHTS.get(event_type)
+        if not settings.JAIL_ENABLED or not weight or not ip:
+            return None
+        return self._add_points(ip, weight)
+
+    def queue_offence(self, event_type: str, ip: Optional[str], on_ban: Callable[[str, int], None]):
+        """`record_offence` on the jail's worker thread; `on_ban(ip, seconds)` reports a new ban.
+
+        For blocking shared-state backends, so strike writes never wait on
+        another worker's lock on the event loop. Points for the same IP are
+        summed while they wait: a flood costs one write per IP per pass, and
+        the backlog is bounded by the number of distinct offending IPs.
+        """
+        weight = OFFENCE_WEIGHTS.get(event_type)
+        if not settings.JAIL_ENABLED or not weight or not ip:
+            return
+        with self._pending_lock:
+            self._pending[ip] = self._pending.get(ip, 0) + weight
+            self._on_ban = on_ban
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="jail-strikes", daemon=True)
+                self._worker.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+                on_ban = self._on_ban
+            for ip, points in pending.items():
+                try:
+                    seconds = self._add_points(ip, points)
+                except Exception as e:
+                    print(f"[JAIL] Failed to record {points} strike points for {ip}: {e}")
+                    continue
+                if seconds and on_ban is not None:
+                    on_ban(ip, seconds)
+
+    def _add_points(self, ip: str, weight: float) -> Optional[int]:
+        points = shared_state.incr(_STRIKES + ip, weight, ttl_seconds=settings.JAIL_STRIKE_WINDOW_SECONDS)
+        if points < settings.JAIL_STRIKE_THRESHOLD or self.is_banned(ip):
+            return None
+
+        shared_state.delete(_STRIKES + ip)
+        level = shared_state.incr(_LEVEL + ip, 1, ttl_seconds=settings.JAIL_LEVEL_MEMORY_SECONDS)
+        seconds = int(min(settings.JAIL_BASE_BAN_SECONDS * 2 ** (level - 1), settings.JAIL_MAX_BAN_SECONDS))
+        self.ban(ip, seconds)
+        return seconds
+
+    def ban(self, ip: str, seconds: int):
+        shared_state.delete(_BAN + ip)
+        shared_state.incr(_BAN + ip, time.time() + seconds, ttl_seconds=seconds)
+
+    def unban(self, ip: str) -> bool:
+        """Lift a ban and forget the IP's strikes and escalation level."""
+        was_banned = self.is_banned(ip) > 0
+        for prefix in (_BAN, _STRIKES, _LEVEL):
+            shared_state.delete(prefix + ip)
+        return was_banned
+
+    def banned(self) -> list:
+        now = time.time()
+        return sorted(
+            (
+                {"ip": key[len(_BAN):], "banned_until": until, "seconds_left": int(until - now)}
+                for key, until in shared_state.scan(_BAN).items()
+            ),
+            key=lambda b: b["banned_until"],
+            reverse=True,
+        )
+
+    def banned_count(self) -> int:
+        return len(shared_state.scan(_BAN))
+
+
+# Global Singleton Instance
+jail = IPJail()
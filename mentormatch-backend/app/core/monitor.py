@@ -1,9 +1,14 @@
 # FILE: app/core/monitor.py
 
 import time
+import math
+import bisect
 import psutil
 import threading
 from dataclasses import dataclass, field
+from app.core.shared_state import shared_state
+from app.core.jail import jail
+from app.core.monitor_writer import monitor_writer
 
 # ---------------------------------------------------------------------------
 # Flush interval – how often in-memory traffic deltas are written to the DB
@@ -21,31 +26,76 @@ def _get_session():
         _SessionLocal = SessionLocal
     return _SessionLocal()
 
+# Cumulative counters live in the shared-state backend so every uvicorn
+# worker reports the same totals (see app/core/shared_state.py).
+_TOTAL_REQUESTS = "monitor:total_requests"
+_TOTAL_LATENCY_MS = "monitor:total_latency_ms"
+_SECURITY_COUNTERS = {
+    "RATE_LIMIT": "monitor:security:rate_limit_hits",
+    "PROMPT_INJECTION": "monitor:security:prompt_injection_hits",
+    "SQLI": "monitor:security:sqli_hits",
+    "BANNED_TOPIC": "monitor:security:banned_topic_hits",
+}
+_CACHE_PREFIX = "monitor:cache:"
+_TIER_PREFIX = "monitor:tier:"
+
+# ---------------------------------------------------------------------------
+# Latency histograms — log-spaced buckets, one counter per
+# (minute, status class, bucket, route). Counters expire after the largest
+# window, so memory is bounded by routes x buckets x 60 minutes.
+# ---------------------------------------------------------------------------
+_HIST_PREFIX = "monitor:hist:"
+_HIST_WINDOWS_MINUTES = (1, 5, 60)
+_HIST_TTL_SECONDS = (max(_HIST_WINDOWS_MINUTES) + 1) * 60
+# Upper bounds (ms): 0.5ms .. ~2min, each bucket 25% wider than the last (~5% error at p99)
+_BUCKET_BOUNDS_MS = [round(0.5 * 1.25 ** i, 3) for i in range(math.ceil(math.log(240_000, 1.25)) + 1)]
+
 
 @dataclass
 class SystemMonitor:
-    # Security Counters (in-memory cache — hydrated from DB at startup)
-    rate_limit_hits: int = 0
-    prompt_injection_hits: int = 0
-    sqli_hits: int = 0
-    banned_topic_hits: int = 0
-    
-    # Traffic Counters  (cumulative: DB-persisted base + in-memory delta)
-    total_requests: int = 0
-    total_latency_ms: float = 0
+    # Security and traffic counters (rate_limit_hits, total_requests, ...) are
+    # properties over the shared-state backend — hydrated from DB at startup.
     start_time: float = field(default_factory=time.time)
     first_started_at: float = field(default_factory=time.time)  # original deploy time from DB
 
-    # --- internal bookkeeping for periodic DB flush ---
+    # --- internal bookkeeping for periodic DB flush (per process: each worker flushes its own deltas) ---
     _requests_since_flush: int = 0
     _latency_since_flush: float = 0.0
     
-    # Logs (in-memory ring buffer — last 50)
+    # Logs (in-memory ring buffer — last 50, per process; the dashboard reads the DB first)
     security_logs: list = field(default_factory=list)
     
     # Lock for thread-safe counter updates
     _lock: threading.Lock = field(default_factory=threading.Lock)
 
+    # ------------------------------------------------------------------
+    # Shared counters
+    # ------------------------------------------------------------------
+
+    @property
+    def total_requests(self) -> int:
+        return int(shared_state.get(_TOTAL_REQUESTS))
+
+    @property
+    def total_latency_ms(self) -> float:
+        return shared_state.get(_TOTAL_LATENCY_MS)
+
+    @property
+    def rate_limit_hits(self) -> int:
+        return int(shared_state.get(_SECURITY_COUNTERS["RATE_LIMIT"]))
+
+    @property
+    def prompt_injection_hits(self) -> int:
+        return int(shared_state.get(_SECURITY_COUNTERS["PROMPT_INJECTION"]))
+
+    @property
+    def sqli_hits(self) -> int:
+        return int(shared_state.get(_SECURITY_COUNTERS["SQLI"]))
+
+    @property
+    def banned_topic_hits(self) -> int:
+        return int(shared_state.get(_SECURITY_COUNTERS["BANNED_TOPIC"]))
+
     # ------------------------------------------------------------------
     # Hydration helpers
     # ------------------------------------------------------------------
@@ -58,21 +108,22 @@ class SystemMonitor:
 
             # --- Security counters ---
             rows = db.execute(
-                text("SELECT event_type, COUNT(*) as cnt FROM security_events GROUP BY event_type")
+                text("SELECT event_type, SUM(event_count) as cnt FROM security_events GROUP BY event_type")
             ).fetchall()
+            # seed() is a no-op if another worker already hydrated the shared counters
             for row in rows:
                 event_type, cnt = row[0], row[1]
-                if event_type == "RATE_LIMIT": self.rate_limit_hits = cnt
-                elif event_type == "PROMPT_INJECTION": self.prompt_injection_hits = cnt
-                elif event_type == "SQLI": self.sqli_hits = cnt
-                elif event_type == "BANNED_TOPIC": self.banned_topic_hits = cnt
+                if event_type in _SECURITY_COUNTERS:
+                    shared_state.seed(_SECURITY_COUNTERS[event_type], cnt)
 
             # Also load last 50 security logs
             log_rows = db.execute(
-                text("SELECT event_type, detail, created_at FROM security_events ORDER BY created_at DESC LIMIT 50")
+                text("SELECT event_type, detail, COALESCE(last_seen_at, created_at) AS seen, event_count "
+                     "FROM security_events ORDER BY seen DESC LIMIT 50")
             ).fetchall()
             self.security_logs = [
                 f"[{r[2].strftime('%H:%M:%S') if r[2] else '??:??:??'}] [{r[0]}] {r[1] or ''}"
+                + (f" (x{r[3]})" if r[3] and r[3] > 1 else "")
                 for r in log_rows
             ]
 
@@ -81,8 +132,8 @@ class SystemMonitor:
                 text("SELECT total_requests, total_latency_ms, first_started_at FROM traffic_metrics WHERE id = 1")
             ).fetchone()
             if tm:
-                self.total_requests = tm[0] or 0
-                self.total_latency_ms = float(tm[1] or 0)
+                shared_state.seed(_TOTAL_REQUESTS, tm[0] or 0)
+                shared_state.seed(_TOTAL_LATENCY_MS, float(tm[1] or 0))
                 if tm[2]:
                     self.first_started_at = tm[2].timestamp()
                 print(f"[MONITOR] Restored traffic: requests={self.total_requests}, latency_ms={self.total_latency_ms}")
@@ -106,11 +157,12 @@ class SystemMonitor:
     # Traffic
     # ------------------------------------------------------------------
 
-    def log_request(self, latency_ms: float):
+    def log_request(self, latency_ms: float, route: str = "unmatched", status_code: int = 200):
         """Called by middleware for every valid request."""
+        shared_state.add(_TOTAL_REQUESTS)
+        shared_state.add(_TOTAL_LATENCY_MS, latency_ms)
+        self._record_latency(latency_ms, route, status_code)
         with self._lock:
-            self.total_requests += 1
-            self.total_latency_ms += latency_ms
             self._requests_since_flush += 1
             self._latency_since_flush += latency_ms
 
@@ -119,7 +171,7 @@ class SystemMonitor:
             self._flush_traffic_to_db()
 
     def _flush_traffic_to_db(self):
-        """Persist accumulated traffic deltas to the DB (fire-and-forget)."""
+        """Hand accumulated traffic deltas to the background writer (non-blocking)."""
         with self._lock:
             delta_req = self._requests_since_flush
             delta_lat = self._latency_since_flush
@@ -129,33 +181,84 @@ class SystemMonitor:
         if delta_req == 0:
             return
 
-        def _persist():
-            try:
-                from sqlalchemy import text
-                db = _get_session()
-                db.execute(text(
-                    "UPDATE traffic_metrics "
-                    "SET total_requests = total_requests + :dr, "
-                    "    total_latency_ms = total_latency_ms + :dl "
-                    "WHERE id = 1"
-                ), {"dr": delta_req, "dl": int(delta_lat)})
-                db.commit()
-                db.close()
-            except Exception as e:
-                print(f"[MONITOR] Failed to flush traffic metrics: {e}")
-
-        threading.Thread(target=_persist, daemon=True).start()
+        monitor_writer.add_traffic(delta_req, delta_lat)
 
     def flush_now(self):
-        """Force-flush remaining traffic deltas (call on shutdown)."""
+        """Force-flush remaining traffic deltas, buffered counters and queued security events (call on shutdown)."""
         self._flush_traffic_to_db()
+        shared_state.flush()
+        monitor_writer.stop()
+
+    # ------------------------------------------------------------------
+    # Latency histograms
+    # ------------------------------------------------------------------
+
+    def _record_latency(self, latency_ms: float, route: str, status_code: int):
+        minute = int(time.time() // 60)
+        bucket = min(bisect.bisect_left(_BUCKET_BOUNDS_MS, latency_ms), len(_BUCKET_BOUNDS_MS) - 1)
+        shared_state.add(
+            f"{_HIST_PREFIX}{minute}:{status_code // 100}xx:{bucket}:{route}", ttl_seconds=_HIST_TTL_SECONDS
+        )
+
+    def _histogram_rows(self, window_minutes: int):
+        """(minute, status_class, bucket, route, count) for the last `window_minutes` minutes."""
+        oldest = int(time.time() // 60) - window_minutes + 1
+        for key, count in shared_state.scan(_HIST_PREFIX).items():
+            minute, status_class, bucket, route = key[len(_HIST_PREFIX):].split(":", 3)
+            if int(minute) >= oldest:
+                yield int(minute), status_class, int(bucket), route, int(count)
+
+    @staticmethod
+    def _summarize(buckets: dict, errors: int) -> dict:
+        """Percentiles (bucket upper bounds, ms) and 5xx rate from {bucket: count}."""
+        total = sum(buckets.values())
+        summary = {"count": total, "error_rate_5xx": round(errors * 100 / total, 2) if total else 0.0}
+        for name, q in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            if not total:
+                summary[name] = 0.0
+                continue
+            rank, seen = math.ceil(q * total), 0
+            for bucket in sorted(buckets):
+                seen += buckets[bucket]
+                if seen >= rank:
+                    summary[name] = _BUCKET_BOUNDS_MS[bucket]
+                    break
+        return summary
+
+    def get_latency_summary(self, window_minutes: int = 5) -> dict:
+        """Overall p50/p95/p99, request count and 5xx rate (%) for a rolling window."""
+        buckets, errors = {}, 0
+        for _, status_class, bucket, _, count in self._histogram_rows(window_minutes):
+            buckets[bucket] = buckets.get(bucket, 0) + count
+            if status_class == "5xx":
+                errors += count
+        return self._summarize(buckets, errors)
+
+    def get_route_latency(self, window_minutes: int = 5) -> list:
+        """Per (route, status class) percentiles for a rolling window, busiest first."""
+        groups = {}
+        for _, status_class, bucket, route, count in self._histogram_rows(window_minutes):
+            buckets = groups.setdefault((route, status_class), {})
+            buckets[bucket] = buckets.get(bucket, 0) + count
+        rows = []
+        for (route, status_class), buckets in groups.items():
+            summary = self._summarize(buckets, 0)
+            del summary["error_rate_5xx"]
+            rows.append({"route": route, "status_class": status_class, **summary})
+        return sorted(rows, key=lambda r: r["count"], reverse=True)
+
+    def get_requests_per_minute_peak(self, window_minutes: int = 60) -> int:
+        per_minute = {}
+        for minute, _, _, _, count in self._histogram_rows(window_minutes):
+            per_minute[minute] = per_minute.get(minute, 0) + count
+        return max(per_minute.values(), default=0)
 
     # ------------------------------------------------------------------
     # Security
     # ------------------------------------------------------------------
 
     def log_security_event(self, event_type: str, detail: str, client_ip: str = None):
-        """Log a security event — persists to DB and updates in-memory counters."""
+        """Log a security event — persists to DB, updates the shared counters and feeds the IP jail."""
         with self._lock:
             # 1. In-memory log (fast reads for dashboard)
             timestamp = time.strftime("%H:%M:%S")
@@ -163,25 +266,62 @@ class SystemMonitor:
             self.security_logs.insert(0, log_entry)
             self.security_logs = self.security_logs[:50]
             
-            # 2. Increment in-memory counters
-            if event_type == "RATE_LIMIT": self.rate_limit_hits += 1
-            elif event_type == "PROMPT_INJECTION": self.prompt_injection_hits += 1
-            elif event_type == "SQLI": self.sqli_hits += 1
-            elif event_type == "BANNED_TOPIC": self.banned_topic_hits += 1
-
-        # 3. Persist to DB (fire-and-forget in a thread to not block middleware)
-        def _persist():
-            try:
-                from app.models.chat import SecurityEvent
-                db = _get_session()
-                evt = SecurityEvent(event_type=event_type, detail=detail, client_ip=client_ip)
-                db.add(evt)
-                db.commit()
-                db.close()
-            except Exception as e:
-                print(f"[MONITOR] Failed to persist security event: {e}")
+        # 2. Increment shared counters
+        if event_type in _SECURITY_COUNTERS:
+            shared_state.add(_SECURITY_COUNTERS[event_type])
+
+        # 3. Repeat offenders go to jail — on the jail's thread when the
+        #    shared state can block (SQLite), so attack traffic never waits on
+        #    another worker's lock on the event loop
+        ban_seconds = None
+        if shared_state.blocking:
+            jail.queue_offence(event_type, client_ip, self._log_ban)
+        else:
+            ban_seconds = jail.record_offence(event_type, client_ip)
+
+        # 4. Persist to DB (queued for the batched background writer — never blocks middleware)
+        monitor_writer.submit_event(event_type, detail, client_ip)
+
+        if ban_seconds:
+            self._log_ban(client_ip, ban_seconds)
+
+    def _log_ban(self, client_ip: str, ban_seconds: int):
+        self.log_security_event("IP_BANNED", f"IP {client_ip} jailed for {ban_seconds}s", client_ip=client_ip)
+
+    # ------------------------------------------------------------------
+    # Caches
+    # ------------------------------------------------------------------
+
+    def log_cache_lookup(self, cache_name: str, hit: bool):
+        """Count one hit or miss for the named cache."""
+        shared_state.add(f"{_CACHE_PREFIX}{cache_name}:{'hits' if hit else 'misses'}")
+
+    def get_cache_stats(self):
+        """Snapshot of every cache's hits, misses and hit rate (%)."""
+        snapshot = {}
+        for key, value in shared_state.scan(_CACHE_PREFIX).items():
+            name, kind = key[len(_CACHE_PREFIX):].rsplit(":", 1)
+            snapshot.setdefault(name, {"hits": 0, "misses": 0})[kind] = int(value)
+        for stats in snapshot.values():
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = round(stats["hits"] * 100 / lookups, 2) if lookups else 0.0
+        return snapshot
+
+    # ------------------------------------------------------------------
+    # Prompt-scan cascade
+    # ------------------------------------------------------------------
+
+    def log_scan_tier(self, tier: str, outcome: str):
+        """Count one outcome (e.g. pass / block / escalate) for a scan tier."""
+        shared_state.add(f"{_TIER_PREFIX}{tier}:{outcome}")
 
-        threading.Thread(target=_persist, daemon=True).start()
+    def get_scan_tier_stats(self):
+        """Snapshot of every tier's outcome counts."""
+        snapshot = {}
+        for key, value in shared_state.scan(_TIER_PREFIX).items():
+            tier, outcome = key[len(_TIER_PREFIX):].rsplit(":", 1)
+            snapshot.setdefault(tier, {})[outcome] = int(value)
+        return snapshot
 
     # ------------------------------------------------------------------
     # Helpers
@@ -0,0 +1,266 @@
+# FILE: app/core/monitor_writer.py
+
+import queue
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from app.core.config import settings
+
+_STOP = object()  # Sentinel: drain and exit
+
+
+class MonitorWriter:
+    """One long-lived thread that persists SystemMonitor data in batches.
+
+    - Security events go through a bounded queue and are bulk-inserted
+      (one multi-row INSERT per batch) every SECURITY_EVENT_FLUSH_MS or
+      SECURITY_EVENT_BATCH_ROWS rows. When the queue is full new events are
+      dropped and counted — under a flood the gateway must stay cheap; the
+      in-memory counters still see every event.
+    - Repeats of the same (event_type, client_ip) within
+      SECURITY_EVENT_AGGREGATE_WINDOW_SECONDS are folded into one row: the
+      first occurrence is inserted, later ones only bump its event_count and
+      last_seen_at. A flood from one IP costs one row per window instead of
+      one per blocked request.
+    - Traffic deltas are summed in place (never dropped) and added to the
+      traffic_metrics row on the same cycle.
+
+    Replaces a thread + DB session per event / per traffic flush.
+    `stop()` drains everything still pending (lifespan shutdown).
+    """
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=settings.SECURITY_EVENT_MAX_QUEUE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self._traffic_requests = 0
+        self._traffic_latency_ms = 0.0
+
+        # (event_type, client_ip) -> open aggregation window (writer thread only)
+        self._aggregates: dict = {}
+
+        self.dropped = 0
+        self.written = 0        # events persisted (rows x event_count)
+        self.rows_inserted = 0
+        self.batches = 0
+        self.last_error: Optional[str] = None
+
+    # ------------------------------------------------------------------
+    # Producer side (any thread)
+    # ------------------------------------------------------------------
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="monitor-writer", daemon=True)
+                self._thread.start()
+
+    def submit_event(self, event_type: str, detail: str, client_ip: Optional[str]) -> bool:
+        """Queue one security event row; False (and counted) if the queue is full."""
+        self._ensure_started()
+        row = {
+            "event_type": event_type,
+            "detail": detail,
+            "client_ip": client_ip,
+            "created_at": datetime.now(timezone.utc),  # event time, not flush time
+        }
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def add_traffic(self, requests: int, latency_ms: float):
+        """Accumulate traffic deltas for the next flush."""
+        self._ensure_started()
+        with self._lock:
+            self._traffic_requests += requests
+            self._traffic_latency_ms += latency_ms
+
+    def stop(self, timeout: float = 10.0):
+        """Flush everything pending, then stop the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._flush([])  # traffic deltas may still be pending
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "max_queue": settings.SECURITY_EVENT_MAX_QUEUE,
+                "dropped": self.dropped,
+                "written": self.written,
+                "rows_inserted": self.rows_inserted,
+                "open_aggregates": len(self._aggregates),
+                "batches": self.batches,
+                "pending_traffic_requests": self._traffic_requests,
+                "last_error": self.last_error,
+            }
+
+    # ------------------------------------------------------------------
+    # Writer thread
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        interval = settings.SECURITY_EVENT_FLUSH_MS / 1000
+        max_rows = settings.SECURITY_EVENT_BATCH_ROWS
+        stopping = False
+
+        while not stopping:
+            rows = []
+            try:
+                item = self._queue.get(timeout=interval)
+                if item is _STOP:
+                    stopping = True
+                else:
+                    rows.append(item)
+            except queue.Empty:
+                pass
+
+            # Keep collecting until the batch is full or the queue runs dry
+            while not stopping and len(rows) < max_rows:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                else:
+                    rows.append(item)
+
+            if stopping:
+                # Durable shutdown: anything enqueued after the sentinel
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        rows.append(item)
+
+            self._flush(rows)
+
+    def _fold(self, rows: list):
+        """Split a batch into rows to INSERT and count bumps for rows already written.
+
+        Returns (inserts, updates): inserts is [(row, aggregate or None)],
+        updates is [aggregate] for windows that gained events this batch.
+        """
+        window = settings.SECURITY_EVENT_AGGREGATE_WINDOW_SECONDS
+        inserts, updates = [], {}
+
+        for event in rows:
+            row = dict(event, event_count=1, first_seen_at=event["created_at"], last_seen_at=event["created_at"])
+            if not window or not row["client_ip"]:
+                inserts.append((row, None))
+                continue
+
+            key = (row["event_type"], row["client_ip"])
+            agg = self._aggregates.get(key)
+            if agg is None or row["created_at"] >= agg["window_end"]:
+                agg = self._aggregates[key] = {
+                    "id": None,
+                    "row": row,
+                    "window_end": row["created_at"] + timedelta(seconds=window),
+                    "pending": 0,
+                    "last_seen_at": row["created_at"],
+                }
+                inserts.append((row, agg))
+            elif agg["id"] is None:
+                # Not inserted yet (same batch) — fold into the pending row
+                agg["row"]["event_count"] += 1
+                agg["row"]["last_seen_at"] = row["created_at"]
+            else:
+                agg["pending"] += 1
+                agg["last_seen_at"] = row["created_at"]
+                updates[key] = agg
+
+        return inserts, list(updates.values())
+
+    def _expire_aggregates(self):
+        now = datetime.now(timezone.utc)
+        self._aggregates = {
+            k: a for k, a in self._aggregates.items()
+            if a["window_end"] > now or a["pending"]
+        }
+
+    def _flush(self, rows: list):
+        with self._lock:
+            delta_req, delta_lat = self._traffic_requests, self._traffic_latency_ms
+            self._traffic_requests, self._traffic_latency_ms = 0, 0.0
+
+        inserts, updates = self._fold(rows)
+        if not inserts and not updates and not delta_req:
+            self._expire_aggregates()
+            return
+
+        from sqlalchemy import bindparam, text
+        from app.core.database import SessionLocal
+        from app.models.chat import SecurityEvent
+
+        table = SecurityEvent.__table__
+        ids = []
+        db = SessionLocal()
+        try:
+            if inserts:
+                ids = db.execute(
+                    table.insert().returning(table.c.id, sort_by_parameter_order=True),
+                    [row for row, _ in inserts],
+                ).scalars().all()
+            if updates:
+                db.execute(
+                    table.update()
+                    .where(table.c.id == bindparam("agg_id"))
+                    .values(event_count=table.c.event_count + bindparam("n"), last_seen_at=bindparam("seen")),
+                    [{"agg_id": a["id"], "n": a["pending"], "seen": a["last_seen_at"]} for a in updates],
+                )
+            if delta_req:
+                db.execute(text(
+                    "UPDATE traffic_metrics "
+                    "SET total_requests = total_requests + :dr, "
+                    "    total_latency_ms = total_latency_ms + :dl "
+                    "WHERE id = 1"
+                ), {"dr": delta_req, "dl": int(delta_lat)})
+            db.commit()
+
+            for (_, agg), row_id in zip(inserts, ids):
+                if agg is not None:
+                    agg["id"] = row_id
+            events = sum(row["event_count"] for row, _ in inserts) + sum(a["pending"] for a in updates)
+            for agg in updates:
+                agg["pending"] = 0
+            with self._lock:
+                self.written += events
+                self.rows_inserted += len(inserts)
+                self.batches += 1
+        except Exception as e:
+            db.rollback()
+            lost = sum(row["event_count"] for row, _ in inserts) + sum(a["pending"] for a in updates)
+            # Forget windows whose row never made it; the next event opens a fresh one
+            for row, agg in inserts:
+                if agg is not None:
+                    self._aggregates.pop((row["event_type"], row["client_ip"]), None)
+            for agg in updates:
+                agg["pending"] = 0
+            with self._lock:
+                self.last_error = str(e)
+                self.dropped += lost
+                # Traffic deltas are cumulative counters — retry them next cycle
+                self._traffic_requests += delta_req
+                self._traffic_latency_ms += delta_lat
+            print(f"[MONITOR] Failed to write {lost} security events / traffic deltas: {e}")
+        finally:
+            db.close()
+            self._expire_aggregates()
+
+
+# Global Singleton Instance
+monitor_writer = MonitorWriter()
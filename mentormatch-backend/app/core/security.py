@@ -86,7 +86,7 @@ def require_super_admin(user: AdminUser = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Super Admin access required")
     return user
 
-def verify_turnstile(token: str):
+def verify_turnstile(token: str, timeout: float = 5):
     if token == "test":
         return True
 
@@ -97,7 +97,7 @@ def verify_turnstile(token: str):
     }
 
     try:
-        outcome = requests.post(url, data=payload, timeout=5).json()
+        outcome = requests.post(url, data=payload, timeout=timeout).json()
         if not outcome.get("success"):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
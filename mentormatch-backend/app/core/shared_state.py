@@ -0,0 +1,320 @@
+# FILE: app/core/shared_state.py
+
+import os
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+from app.core.config import settings
+
+# How often expired keys / fully refilled buckets are swept out
+_SWEEP_INTERVAL_SECONDS = 60
+# How often buffered `add()` deltas are written (SQLite backend)
+_ADD_FLUSH_SECONDS = 0.1
+
+
+class SharedStateBackend(ABC):
+    """Counters and token buckets the rate limiter and SystemMonitor keep.
+
+    "memory" keeps them in this process (one uvicorn worker). "sqlite" keeps
+    them in a SQLite file on tmpfs (/dev/shm by default) that every worker
+    on the host opens, so limits and dashboard totals are the same no matter
+    which worker serves a request. Every operation is atomic.
+
+    `blocking` backends do I/O that can wait on another worker's lock:
+    callers on the event loop should push the ones whose answer they need
+    (take_token, incr) to a thread, and use `add()` for the rest.
+    """
+
+    blocking = False
+
+    @abstractmethod
+    def incr(self, key: str, amount: float = 1, ttl_seconds: Optional[float] = None) -> float:
+        """Add `amount` to a counter (created at 0) and return the new value.
+
+        With `ttl_seconds`, a counter that doesn't exist yet expires that long after creation.
+        """
+
+    def add(self, key: str, amount: float = 1, ttl_seconds: Optional[float] = None):
+        """Fire-and-forget `incr` — may be applied a moment later, in a batch."""
+        self.incr(key, amount, ttl_seconds)
+
+    def flush(self):
+        """Apply any buffered `add()` deltas now (shutdown)."""
+
+    @abstractmethod
+    def get(self, key: str, default: float = 0) -> float:
+        ...
+
+    @abstractmethod
+    def seed(self, key: str, value: float) -> bool:
+        """Set a counter only if it doesn't exist yet (startup hydration by the first worker)."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def scan(self, prefix: str) -> dict:
+        """All live counters whose key starts with `prefix`."""
+
+    @abstractmethod
+    def take_token(self, key: str, capacity: int, per_seconds: float) -> float:
+        """Token bucket: consume one token. Returns 0 if allowed, else seconds until one is available."""
+
+
+def _refill(bucket, capacity: int, rate: float, now: float):
+    """Shared token-bucket math. `bucket` is (tokens, updated_at) or None.
+
+    Returns (retry_after, tokens, full_at); full_at is when the bucket would be
+    full again — after that it's indistinguishable from a new one and can go.
+    """
+    tokens = float(capacity) if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate, tokens, now + (capacity - tokens) / rate
+    tokens -= 1
+    return 0.0, tokens, now + (capacity - tokens) / rate
+
+
+class MemoryStateBackend(SharedStateBackend):
+    """Process-local state (single worker, or when sharing isn't needed)."""
+
+    def __init__(self):
+        self._counters: dict = {}   # key -> [value, expires_at | None]
+        self._buckets: dict = {}    # key -> [tokens, updated_at, full_at]
+        self._lock = threading.Lock()
+        self._next_sweep = time.time() + _SWEEP_INTERVAL_SECONDS
+
+    def _maybe_sweep(self, now: float):
+        if now < self._next_sweep:
+            return
+        self._counters = {k: c for k, c in self._counters.items() if c[1] is None or c[1] > now}
+        self._buckets = {k: b for k, b in self._buckets.items() if b[2] > now}
+        self._next_sweep = now + _SWEEP_INTERVAL_SECONDS
+
+    def _live(self, key: str, now: float):
+        counter = self._counters.get(key)
+        if counter is not None and counter[1] is not None and counter[1] <= now:
+            del self._counters[key]
+            return None
+        return counter
+
+    def incr(self, key, amount=1, ttl_seconds=None):
+        now = time.time()
+        with self._lock:
+            self._maybe_sweep(now)
+            counter = self._live(key, now)
+            if counter is None:
+                counter = self._counters[key] = [0, now + ttl_seconds if ttl_seconds else None]
+            counter[0] += amount
+            return counter[0]
+
+    def get(self, key, default=0):
+        with self._lock:
+            counter = self._live(key, time.time())
+            return default if counter is None else counter[0]
+
+    def seed(self, key, value):
+        with self._lock:
+            if self._live(key, time.time()) is not None:
+                return False
+            self._counters[key] = [value, None]
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._counters.pop(key, None)
+
+    def scan(self, prefix):
+        now = time.time()
+        with self._lock:
+            return {
+                k: c[0] for k, c in self._counters.items()
+                if k.startswith(prefix) and (c[1] is None or c[1] > now)
+            }
+
+    def take_token(self, key, capacity, per_seconds):
+        now = time.time()
+        with self._lock:
+            self._maybe_sweep(now)
+            bucket = self._buckets.get(key)
+            retry_after, tokens, full_at = _refill(bucket, capacity, capacity / per_seconds, now)
+            self._buckets[key] = [tokens, now, full_at]
+            return retry_after
+
+
+class SQLiteStateBackend(SharedStateBackend):
+    """State shared by every worker on the host through one SQLite file.
+
+    Put the file on tmpfs (/dev/shm) so it never touches disk — each
+    operation is a short local transaction (tens of microseconds
+    uncontended). BEGIN IMMEDIATE serializes read-modify-write across
+    processes, so under contention a call can wait for other workers'
+    transactions (up to the 2s busy timeout): the gateway runs its
+    checks in a thread for this backend, jail strikes are written by the
+    jail's own thread (IPJail.queue_offence), and monitor counters go
+    through `add()`, which buffers deltas in process and writes them all
+    in one transaction every _ADD_FLUSH_SECONDS from a background thread.
+    scripts/bench_shared_state.py measures the contended worst case.
+
+    The file outlives worker restarts (until reboot); delete it to reset.
+    """
+
+    blocking = True
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value REAL NOT NULL, expires_at REAL)",
+        "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+        "updated_at REAL NOT NULL, full_at REAL NOT NULL)",
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()  # one connection per thread
+        self._sweep_lock = threading.Lock()
+        self._next_sweep = 0.0
+        self._deltas: dict = {}      # key -> [amount, ttl_seconds], pending add()s
+        self._deltas_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        with conn:
+            for ddl in self._SCHEMA:
+                conn.execute(ddl)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: we issue BEGIN IMMEDIATE ourselves
+            conn = sqlite3.connect(self.path, timeout=2.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, fn):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _maybe_sweep(self, now: float):
+        if now < self._next_sweep or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sweep = now + _SWEEP_INTERVAL_SECONDS
+            conn = self._conn()
+            conn.execute("DELETE FROM counters WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            conn.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+        finally:
+            self._sweep_lock.release()
+
+    @staticmethod
+    def _incr_row(conn, key, amount, ttl_seconds, now):
+        # Expired counters restart from zero with a fresh TTL
+        conn.execute("DELETE FROM counters WHERE key = ? AND expires_at <= ?", (key, now))
+        conn.execute(
+            "INSERT INTO counters (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+            (key, amount, now + ttl_seconds if ttl_seconds else None),
+        )
+        return conn.execute("SELECT value FROM counters WHERE key = ?", (key,)).fetchone()[0]
+
+    def incr(self, key, amount=1, ttl_seconds=None):
+        now = time.time()
+        self._maybe_sweep(now)
+        return self._transaction(lambda conn: self._incr_row(conn, key, amount, ttl_seconds, now))
+
+    def add(self, key, amount=1, ttl_seconds=None):
+        with self._deltas_lock:
+            delta = self._deltas.get(key)
+            if delta is None:
+                self._deltas[key] = [amount, ttl_seconds]
+            else:
+                delta[0] += amount
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run_flusher, name="shared-state-flush", daemon=True)
+                self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(_ADD_FLUSH_SECONDS)
+            self.flush()
+
+    def flush(self):
+        with self._deltas_lock:
+            deltas, self._deltas = self._deltas, {}
+        if not deltas:
+            return
+        now = time.time()
+        self._maybe_sweep(now)
+
+        def _apply(conn):
+            for key, (amount, ttl_seconds) in deltas.items():
+                self._incr_row(conn, key, amount, ttl_seconds, now)
+
+        try:
+            self._transaction(_apply)
+        except sqlite3.Error as e:
+            print(f"[STATE] Dropped {len(deltas)} buffered counter updates: {e}")
+
+    def get(self, key, default=0):
+        row = self._conn().execute(
+            "SELECT value FROM counters WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return default if row is None else row[0]
+
+    def seed(self, key, value):
+        cur = self._conn().execute(
+            "INSERT OR IGNORE INTO counters (key, value, expires_at) VALUES (?, ?, NULL)", (key, value)
+        )
+        return cur.rowcount == 1
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM counters WHERE key = ?", (key,))
+
+    def scan(self, prefix):
+        # Prefix match via a range scan on the primary key (no LIKE escaping needed)
+        rows = self._conn().execute(
+            "SELECT key, value FROM counters WHERE key >= ? AND key < ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (prefix, prefix + "\U0010ffff", time.time()),
+        ).fetchall()
+        return dict(rows)
+
+    def take_token(self, key, capacity, per_seconds):
+        now = time.time()
+        self._maybe_sweep(now)
+
+        def _take(conn):
+            bucket = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            retry_after, tokens, full_at = _refill(bucket, capacity, capacity / per_seconds, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, full_at),
+            )
+            return retry_after
+
+        return self._transaction(_take)
+
+
+def create_backend(kind: str, path: str) -> SharedStateBackend:
+    if kind == "sqlite":
+        print(f"[STATE] Sharing rate-limit / monitor state across workers via {path}")
+        return SQLiteStateBackend(path)
+    if kind != "memory":
+        print(f"[STATE] Unknown SHARED_STATE_BACKEND={kind!r}, using process memory")
+    return MemoryStateBackend()
+
+
+# Global Singleton Instance
+shared_state = create_backend(settings.SHARED_STATE_BACKEND, settings.SHARED_STATE_PATH)
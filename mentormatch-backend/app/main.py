@@ -3,18 +3,20 @@
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
-import time
+import asyncio
 
 # Core Imports
-from app.core.database import engine, Base
+from app.core.database import engine, Base, upgrade_schema
 from app.core.config import settings
 from fastapi.middleware.cors import CORSMiddleware
 
 # Middleware Imports
 from app.core.monitor import monitor
-from app.middleware.rate_limiter import rate_limit_middleware
-from app.middleware.security import sanitize_input_middleware
+from app.middleware.gateway import GatewayMiddleware
 from app.api.endpoints import chat, admin
+from app.services.chatvat import chatvat_service
+from app.services.chat_writer import chat_writer
+from app.middleware import prompt_guard
 
 # Ensure ALL models are imported so create_all picks them up (including TrafficMetric)
 import app.models.chat  # noqa: F401
@@ -22,6 +24,8 @@ import app.models.chat  # noqa: F401
 # 1. Initialize Database Tables
 # This looks at all models imported above and creates them in Postgres if missing.
 Base.metadata.create_all(bind=engine)
+# ...and add columns introduced since the tables were first created.
+upgrade_schema()
 
 # 1b. Hydrate security monitor from persisted DB data (survives restarts)
 monitor.hydrate_from_db()
@@ -30,10 +34,20 @@ monitor.hydrate_from_db()
 # Lifespan — flush traffic metrics on shutdown so nothing is lost
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Startup: background flusher for write-behind chat persistence (if enabled)
+    chat_writer.start()
+    # Startup: load + warm the LLM-Guard models without blocking the port bind
+    warmup_task = asyncio.create_task(prompt_guard.warm_up_scanners())
     yield
-    # Shutdown: persist any remaining in-memory traffic deltas
-    print("[SHUTDOWN] Flushing traffic metrics to DB …")
-    monitor.flush_now()
+    if not warmup_task.done():
+        warmup_task.cancel()
+    # Shutdown: durably flush queued chat sessions/messages first
+    await chat_writer.stop()
+    # Shutdown: persist any remaining traffic deltas and queued security events
+    print("[SHUTDOWN] Flushing traffic metrics and security events to DB …")
+    await asyncio.to_thread(monitor.flush_now)
+    # Close the pooled keep-alive connections to ChatVat
+    await chatvat_service.aclose()
 
 
 # 2. Initialize App
@@ -67,19 +81,10 @@ async def global_exception_handler(request: Request, exc: Exception):
         }
     )
 
-# 4. MONITORING MIDDLEWARE (Must be First!)
-# This tracks latency and request counts for your Admin Dashboard.
-@app.middleware("http")
-async def monitor_traffic_middleware(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    latency = (time.time() - start_time) * 1000
-    monitor.log_request(latency)
-    return response
-
-# 5. SECURITY MIDDLEWARE (The "Bouncers")
-app.middleware("http")(sanitize_input_middleware) # Checks for massive payloads / SQLi patterns
-app.middleware("http")(rate_limit_middleware)     # Checks IP rate limits
+# 4-5. GATEWAY MIDDLEWARE (The "Bouncers" + Monitoring), one pure-ASGI layer.
+# Added last = outermost. In order: IP jail -> rate limit -> payload/SQLi
+# checks -> latency & request counts for your Admin Dashboard -> CORS -> routes.
+app.add_middleware(GatewayMiddleware)
 
 # 6. REGISTER ROUTES
 # Public Chat API -> /api/v1/chat
@@ -93,6 +98,14 @@ app.include_router(admin.router, prefix="/api/v1/admin", tags=["Admin Dashboard"
 def health_check():
     return {"status": "healthy", "service": "MentorMatch Gateway"}
 
+# 7b. READINESS CHECK — healthy AND able to serve chat (security models warmed)
+@app.get("/ready")
+def readiness_check():
+    state = prompt_guard.readiness()
+    if not state["ready"]:
+        return JSONResponse(status_code=503, content={"status": "starting", **state})
+    return {"status": "ready", **state}
+
 # 8. DB CONNECTION TEST
 from fastapi import Depends
 from sqlalchemy.orm import Session
@@ -0,0 +1,25 @@
+# FILE: app/middleware/ip_jail.py
+
+from math import ceil
+from typing import Optional
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from app.core.client_ip import get_client_ip
+from app.core.jail import jail
+
+# Admins must always be able to reach the dashboard (and unban themselves)
+JAIL_EXEMPT_PREFIXES = ("/health", "/ready", "/api/v1/admin")
+
+def check_jail(request: Request) -> Optional[JSONResponse]:
+    """403 for a jailed IP, else None. Runs first in the gateway: before the
+    body is read, before rate limiting, scanning or any DB work."""
+    path = request.url.path
+    if not any(path.startswith(p) for p in JAIL_EXEMPT_PREFIXES):
+        seconds_left = jail.is_banned(get_client_ip(request))
+        if seconds_left:
+            return JSONResponse(
+                status_code=403,
+                content={"detail": "Access temporarily blocked due to repeated abuse."},
+                headers={"Retry-After": str(ceil(seconds_left))},
+            )
+    return None
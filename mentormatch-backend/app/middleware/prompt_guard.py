@@ -1,31 +1,426 @@
 # FILE: app/middleware/prompt_guard.py
 
-from llm_guard.input_scanners import PromptInjection, BanTopics
+import os
+import re
+import json
+import time
+import random
+import platform
+import asyncio
+import hashlib
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException
+from app.core.batching import MicroBatcher
+from app.core.cache import TTLCache
+from app.core.config import settings
 from app.core.monitor import monitor
+from app.middleware import prompt_prefilter
 
-# Initialize Scanners ONCE (These load ML models, might take time on startup)
-print("Initializing Security Models... (This may take a few seconds)")
-injection_scanner = PromptInjection(threshold=0.5) 
-topic_scanner = BanTopics(topics=["politics", "crypto", "nsfw", "gambling"], threshold=0.75)
+INJECTION_THRESHOLD = 0.5
+TOPIC_THRESHOLD = 0.75
+BANNED_TOPICS = ["politics", "crypto", "nsfw", "gambling"]
 
-def scan_prompt(user_text: str):
+# Scanners load lazily: llm_guard pulls in torch and the models, so building
+# them at import time delayed every (re)start before uvicorn could bind the
+# port. `warm_up_scanners()` builds them in the background after startup;
+# until it finishes, scan_prompt answers with a fast 503.
+injection_scanner = None
+topic_scanner = None
+calculate_risk_score = None
+_ready = False
+_load_error = None
+
+WARMUP_PROMPT = "Hi! How do I find a mentor for my final-year project?"
+
+def _backend_name() -> str:
+    if not settings.PROMPT_GUARD_USE_ONNX:
+        return "torch"
+    return "onnx-int8" if settings.PROMPT_GUARD_ONNX_QUANTIZE else "onnx"
+
+# ---------------------------------------------------------------------------
+# Batched inference
+# ---------------------------------------------------------------------------
+# LLM-Guard's scan() classifies one prompt per call. These helpers run the
+# scanners' underlying HF pipelines over a whole batch in one forward pass
+# and apply the same scoring rules as PromptInjection.scan / BanTopics.scan.
+# Each returns one (is_valid, risk_score) tuple per prompt, in order.
+#
+# The pipelines are private llm_guard attributes (requirements.txt pins the
+# version they were checked against). _load_scanners() verifies they exist;
+# if an upgrade renames them, every batch falls back to scan() per prompt.
+
+_INJECTION_ATTRS = ("_pipeline", "_threshold")
+_TOPIC_ATTRS = ("_classifier", "_topics", "_threshold")
+_batched_inference = True
+
+def _scan_each(scanner, prompts: list) -> list:
+    verdicts = []
+    for prompt in prompts:
+        _, valid, score = scanner.scan(prompt)
+        verdicts.append((valid, score))
+    return verdicts
+
+def _injection_batch(prompts: list) -> list:
+    if not _batched_inference:
+        return _scan_each(injection_scanner, prompts)
+
+    verdicts = [(True, -1.0)] * len(prompts)
+    idx = [i for i, p in enumerate(prompts) if p.strip()]
+    if not idx:
+        return verdicts
+
+    threshold = injection_scanner._threshold
+    results = injection_scanner._pipeline([prompts[i] for i in idx], batch_size=len(idx))
+    for i, result in zip(idx, results):
+        score = round(result["score"] if result["label"] == "INJECTION" else 1 - result["score"], 2)
+        verdicts[i] = (score <= threshold, calculate_risk_score(score, threshold))
+    return verdicts
+
+def _topic_batch(prompts: list) -> list:
+    if not _batched_inference:
+        return _scan_each(topic_scanner, prompts)
+
+    verdicts = [(True, -1.0)] * len(prompts)
+    idx = [i for i, p in enumerate(prompts) if p.strip()]
+    if not idx:
+        return verdicts
+
+    threshold = topic_scanner._threshold
+    outputs = topic_scanner._classifier(
+        [prompts[i] for i in idx], topic_scanner._topics, multi_label=False, batch_size=len(idx)
+    )
+    if isinstance(outputs, dict):  # the pipeline unwraps single-item batches
+        outputs = [outputs]
+    for i, output in zip(idx, outputs):
+        score = round(max(output["scores"]) if output["scores"] else 0, 2)
+        verdicts[i] = (score <= threshold, calculate_risk_score(score, threshold))
+    return verdicts
+
+# ---------------------------------------------------------------------------
+# Scanner worker pool
+# ---------------------------------------------------------------------------
+# Model inference runs on its own threads instead of the shared request
+# threadpool, so both models can run at once and a burst of scans can't
+# starve DB / Turnstile calls. Torch releases the GIL inside its kernels;
+# capping its intra-op threads keeps the parallel models from oversubscribing
+# the CPU.
+
+def _torch_threads() -> int:
+    if settings.PROMPT_GUARD_TORCH_THREADS > 0:
+        return settings.PROMPT_GUARD_TORCH_THREADS
+    return max(1, (os.cpu_count() or 1) // max(1, settings.PROMPT_GUARD_WORKERS))
+
+def _limit_torch_threads():
+    if settings.PROMPT_GUARD_TORCH_THREADS < 0:
+        return
+    try:
+        import torch
+        torch.set_num_threads(_torch_threads())
+    except ImportError:
+        pass
+
+scan_executor = ThreadPoolExecutor(
+    max_workers=settings.PROMPT_GUARD_WORKERS, thread_name_prefix="prompt-guard"
+)
+
+# Concurrent chats share a forward pass: prompts arriving within a few ms
+# are scanned together. One batch per model at a time — the HF pipeline and
+# its fast tokenizer aren't safe to call from two threads ("Already
+# borrowed"); the two models still run in parallel on the pool.
+injection_batcher = MicroBatcher(
+    "prompt_injection", _injection_batch,
+    max_batch_size=settings.PROMPT_GUARD_BATCH_MAX_SIZE,
+    max_wait_ms=settings.PROMPT_GUARD_BATCH_MAX_WAIT_MS,
+    executor=scan_executor,
+    max_in_flight=1,
+)
+topic_batcher = MicroBatcher(
+    "ban_topics", _topic_batch,
+    max_batch_size=settings.PROMPT_GUARD_BATCH_MAX_SIZE,
+    max_wait_ms=settings.PROMPT_GUARD_BATCH_MAX_WAIT_MS,
+    executor=scan_executor,
+    max_in_flight=1,
+)
+
+def scanner_stats() -> dict:
+    """Queue depth and per-model batch latency for the admin dashboard."""
+    return {
+        "ready": _ready,
+        "backend": _backend_name(),
+        "workers": settings.PROMPT_GUARD_WORKERS,
+        "batched_inference": _batched_inference,
+        "torch_threads": _torch_threads() if settings.PROMPT_GUARD_TORCH_THREADS >= 0 else None,
+        "models": [injection_batcher.stats(), topic_batcher.stats()],
+        "verdict_cache_entries": len(verdict_cache),
+        "tiers": monitor.get_scan_tier_stats(),
+    }
+
+# ---------------------------------------------------------------------------
+# Verdict cache
+# ---------------------------------------------------------------------------
+# Greetings, FAQ-style questions and retries after a 503 are scanned over and
+# over. The models are deterministic, so a verdict can be reused for the same
+# text under the same scanner config.
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def _scanner_fingerprint() -> str:
+    # Any config that changes a verdict must change the key
+    return json.dumps({
+        "injection_threshold": INJECTION_THRESHOLD,
+        "topic_threshold": TOPIC_THRESHOLD,
+        "topics": sorted(BANNED_TOPICS),
+        "backend": _backend_name(),
+    }, sort_keys=True)
+
+_SCANNER_FINGERPRINT = _scanner_fingerprint()
+
+verdict_cache = TTLCache(
+    max_entries=settings.PROMPT_GUARD_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.PROMPT_GUARD_CACHE_TTL_SECONDS,
+)
+
+def _verdict_key(user_text: str) -> str:
+    # Unicode/whitespace-insensitive only: case and punctuation can change
+    # what the (cased) models see, so they stay part of the key.
+    normalized = _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", user_text)).strip()
+    return hashlib.sha256(f"{_SCANNER_FINGERPRINT}\x00{normalized}".encode("utf-8")).hexdigest()
+
+async def _scan_models(user_text: str):
+    """((injection_valid, injection_score), (topic_valid, topic_score)), cached."""
+    key = _verdict_key(user_text) if settings.PROMPT_GUARD_CACHE_ENABLED else None
+    if key is not None:
+        verdict = verdict_cache.get(key)
+        monitor.log_cache_lookup("prompt_guard", verdict is not None)
+        if verdict is not None:
+            return verdict
+
+    verdict = await _scan_windows(user_text)
+
+    if key is not None:
+        verdict_cache.set(key, verdict)
+    return verdict
+
+# ---------------------------------------------------------------------------
+# Long messages: overlapping windows
+# ---------------------------------------------------------------------------
+# The models see at most 512 tokens; a 5000-char message scanned as one
+# sequence is slow and silently truncated. Long prompts are split into
+# overlapping windows (so a payload straddling a boundary is still seen
+# whole), all windows go through the batchers together, and the scan stops
+# at the first failing window.
+
+def _windows(text: str) -> list:
+    size = settings.PROMPT_GUARD_WINDOW_CHARS
+    if len(text) <= size:
+        return [text]
+    overlap = min(settings.PROMPT_GUARD_WINDOW_OVERLAP_CHARS, size // 4)
+
+    windows, start = [], 0
+    while True:
+        end = min(start + size, len(text))
+        if end < len(text):
+            # Prefer to cut on a word boundary inside the overlap zone
+            cut = text.rfind(" ", end - overlap, end)
+            if cut > start:
+                end = cut
+        windows.append(text[start:end])
+        if end >= len(text):
+            return windows
+        start = end - overlap
+        space = text.find(" ", start, end)
+        if space != -1:
+            start = space + 1
+
+async def _scan_windows(user_text: str):
+    """Scan every window with both models; same shape as a single-prompt verdict.
+
+    The message is valid only if every window is; the score is the worst window's.
+    A failing injection window ends the scan at once. A failing topic window
+    cancels the remaining topic windows but still waits for injection, which
+    takes precedence when both fail.
+    """
+    windows = _windows(user_text)
+    loop = asyncio.get_running_loop()
+    kinds = {}
+    for window in windows:
+        kinds[loop.create_task(injection_batcher.submit(window))] = "injection"
+        kinds[loop.create_task(topic_batcher.submit(window))] = "topic"
+
+    verdicts = {"injection": (True, -1.0), "topic": (True, -1.0)}
+    pending = set(kinds)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                valid, score = task.result()
+                kind = kinds[task]
+                verdicts[kind] = (verdicts[kind][0] and valid, max(verdicts[kind][1], score))
+
+            if not verdicts["injection"][0]:
+                break
+            if not verdicts["topic"][0]:
+                for task in [t for t in pending if kinds[t] == "topic"]:
+                    task.cancel()
+                    pending.discard(task)
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return verdicts["injection"], verdicts["topic"]
+
+# ---------------------------------------------------------------------------
+# Model loading / readiness
+# ---------------------------------------------------------------------------
+
+def _quantize_pipeline(name: str, pipe):
+    """Swap `pipe.model` (ONNX Runtime) for a dynamic int8-quantized copy.
+
+    The quantized model is written once to PROMPT_GUARD_ONNX_CACHE_DIR and
+    reused on later starts. Falls back to the fp32 ONNX model on any error.
+    """
+    try:
+        from optimum.onnxruntime import ORTQuantizer, ORTModelForSequenceClassification
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        save_dir = os.path.join(settings.PROMPT_GUARD_ONNX_CACHE_DIR, name)
+        file_name = "model_quantized.onnx"
+        if not os.path.exists(os.path.join(save_dir, file_name)):
+            if platform.machine().lower() in ("aarch64", "arm64"):
+                qconfig = AutoQuantizationConfig.arm64(is_static=False, per_channel=False)
+            else:
+                qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+            ORTQuantizer.from_pretrained(pipe.model).quantize(save_dir=save_dir, quantization_config=qconfig)
+
+        pipe.model = ORTModelForSequenceClassification.from_pretrained(save_dir, file_name=file_name)
+    except Exception as e:
+        print(f"[PROMPT_GUARD] int8 quantization failed for {name}, using fp32 ONNX: {e}")
+
+def build_scanners(use_onnx: bool, quantize: bool = False):
+    """Construct (PromptInjection, BanTopics) on the torch or ONNX Runtime backend."""
+    from llm_guard.input_scanners import PromptInjection, BanTopics
+
+    injection = PromptInjection(threshold=INJECTION_THRESHOLD, use_onnx=use_onnx)
+    topics = BanTopics(topics=BANNED_TOPICS, threshold=TOPIC_THRESHOLD, use_onnx=use_onnx)
+    if use_onnx and quantize and _supports_batching(injection, topics):
+        _quantize_pipeline("prompt_injection", injection._pipeline)
+        _quantize_pipeline("ban_topics", topics._classifier)
+    return injection, topics
+
+def _supports_batching(injection, topics) -> bool:
+    """True if the llm_guard internals the batch helpers rely on are present."""
+    return (all(hasattr(injection, a) for a in _INJECTION_ATTRS)
+            and all(hasattr(topics, a) for a in _TOPIC_ATTRS))
+
+def _load_scanners():
+    """Build both scanners and run one dummy inference each (blocking)."""
+    global injection_scanner, topic_scanner, calculate_risk_score, _ready, _batched_inference
+
+    from llm_guard.util import calculate_risk_score as _risk_score
+
+    start = time.perf_counter()
+    _limit_torch_threads()
+    calculate_risk_score = _risk_score
+    injection_scanner, topic_scanner = build_scanners(
+        use_onnx=settings.PROMPT_GUARD_USE_ONNX,
+        quantize=settings.PROMPT_GUARD_ONNX_QUANTIZE,
+    )
+    _batched_inference = _supports_batching(injection_scanner, topic_scanner)
+    if not _batched_inference:
+        print("[PROMPT_GUARD] llm_guard internals changed; scanning prompts one at a time")
+
+    # First inference allocates buffers / JITs kernels — pay it here, not on a user
+    _injection_batch([WARMUP_PROMPT])
+    _topic_batch([WARMUP_PROMPT])
+
+    _ready = True
+    print(f"[PROMPT_GUARD] Security models ready ({_backend_name()}) in {time.perf_counter() - start:.1f}s")
+
+async def warm_up_scanners():
+    """Load and warm the models on the scanner pool (run as a startup background task)."""
+    global _load_error
+    print("Initializing Security Models in the background...")
+    try:
+        await asyncio.get_running_loop().run_in_executor(scan_executor, _load_scanners)
+    except Exception as e:
+        _load_error = str(e)
+        print(f"[PROMPT_GUARD] Failed to load security models: {e}")
+
+def is_ready() -> bool:
+    return _ready
+
+def readiness() -> dict:
+    return {"ready": _ready, "error": _load_error}
+
+def _not_ready_error() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Our safety checks are still starting up. Please try again in a few seconds.",
+        headers={"Retry-After": "5"},
+    )
+
+# ---------------------------------------------------------------------------
+# Cascade: lexical pre-filter -> verdict cache -> ML scanners
+# ---------------------------------------------------------------------------
+
+_shadow_tasks: set = set()
+
+async def _shadow_check(user_text: str):
+    """Run the models on a message the pre-filter cleared, to estimate its false negatives."""
+    try:
+        (injection_valid, _), (topic_valid, _) = await _scan_models(user_text)
+    except Exception:
+        return
+    if injection_valid and topic_valid:
+        monitor.log_scan_tier("shadow", "agree")
+    else:
+        monitor.log_scan_tier("shadow", "false_negative")
+        print(f"[PROMPT_GUARD] Pre-filter passed a message the models block: {user_text[:80]!r}")
+
+def _sample_shadow(user_text: str):
+    if not _ready or random.random() >= settings.PROMPT_GUARD_PREFILTER_SHADOW_RATE:
+        return
+    task = asyncio.get_running_loop().create_task(_shadow_check(user_text))
+    _shadow_tasks.add(task)
+    task.add_done_callback(_shadow_tasks.discard)
+
+async def scan_prompt(user_text: str, client_ip: str = None):
     """
     Scans the prompt using LLM-Guard.
-    Raises HTTPException if malicious.
+    Raises HTTPException if malicious (400) or if the models aren't loaded yet (503).
+    `client_ip` is attached to security events (repeat offenders get jailed).
     """
-    # 1. Injection Scanner
-    sanitized_prompt, results_valid, results_score = injection_scanner.scan(user_text)
-    
-    if not results_valid:
-        monitor.log_security_event("PROMPT_INJECTION", f"Score: {results_score}")
+    # Tier 0: lexical pre-filter (works even while the models are warming up)
+    if settings.PROMPT_GUARD_PREFILTER_ENABLED:
+        verdict = prompt_prefilter.classify(user_text)
+        if verdict == prompt_prefilter.INJECTION:
+            monitor.log_scan_tier("prefilter", "block")
+            monitor.log_security_event("PROMPT_INJECTION", "Pre-filter: known injection phrasing", client_ip=client_ip)
+            raise HTTPException(status_code=400, detail="Security alert: Malicious prompt detected.")
+        if verdict == prompt_prefilter.BENIGN:
+            monitor.log_scan_tier("prefilter", "pass")
+            _sample_shadow(user_text)
+            return user_text
+        monitor.log_scan_tier("prefilter", "escalate")
+
+    if not _ready:
+        raise _not_ready_error()
+
+    # Tier 1: ML scanners (behind the verdict cache)
+    (injection_valid, injection_score), (topic_valid, _) = await _scan_models(user_text)
+
+    # 1. Injection Scanner (takes precedence when both fail)
+    if not injection_valid:
+        monitor.log_scan_tier("ml", "block")
+        monitor.log_security_event("PROMPT_INJECTION", f"Score: {injection_score}", client_ip=client_ip)
         raise HTTPException(status_code=400, detail="Security alert: Malicious prompt detected.")
 
     # 2. Topic Scanner
-    sanitized_prompt, results_valid, results_score = topic_scanner.scan(user_text)
-    
-    if not results_valid:
-        monitor.log_security_event("BANNED_TOPIC", "User discussed banned topic")
+    if not topic_valid:
+        monitor.log_scan_tier("ml", "block")
+        monitor.log_security_event("BANNED_TOPIC", "User discussed banned topic", client_ip=client_ip)
         raise HTTPException(status_code=400, detail="Let's keep the conversation focused on mentorship.")
 
-    return sanitized_prompt
\ No newline at end of file
+    monitor.log_scan_tier("ml", "pass")
+    return user_text
@@ -0,0 +1,50 @@
+# FILE: app/middleware/prompt_prefilter.py
+
+import re
+from typing import Optional
+
+# Tier 0 of the prompt-scan cascade: a cheap lexical pass that settles the
+# obvious cases so only ambiguous messages pay for the transformer models.
+#
+#   BENIGN     -> pass without model inference (greetings, thanks, ...)
+#   INJECTION  -> block immediately (unambiguous jailbreak phrasing only)
+#   None       -> ambiguous, escalate to the ML scanners
+#
+# Keep both lists conservative: a false "benign" skips the models entirely
+# (shadow sampling in prompt_guard estimates how often that happens), and a
+# false "injection" blocks a real student.
+
+BENIGN = "benign"
+INJECTION = "injection"
+
+# Whole-message small talk only — anything with more content is ambiguous
+_BENIGN_RE = re.compile(
+    r"^(?:(?:hi|hii+|hello|hey|heya|yo|namaste|good (?:morning|afternoon|evening))"
+    r"(?: there| mentor| team| everyone)?"
+    r"|thanks?(?: you)?(?: so much| a lot| again)?|thx|ty|ok(?:ay)?|cool|great|got it|sure|yes|no"
+    r"|bye|goodbye|see you|cya)"
+    r"[\s!.,:)]*$",
+    re.IGNORECASE,
+)
+
+# Hard blocks: phrasing with no plausible innocent reading. Looser cues
+# ("forget the previous messages", "do anything now", "developer mode") also
+# turn up in normal chat, so they are left to the ML tier (classify -> None).
+_INJECTION_RE = re.compile(
+    r"|".join([
+        r"\b(?:ignore|disregard)\s+(?:all\s+)?(?:previous|prior)\s+instructions\b",
+        r"\b(?:ignore|disregard|override)\s+(?:your|the)\s+system\s+(?:prompt|instructions)\b",
+        r"\b(?:reveal|print|show|repeat|leak)\s+(?:me\s+)?(?:your|the)\s+(?:system|hidden|initial)\s+prompt\b",
+        r"\byou\s+are\s+now\s+(?:dan|jailbroken|unfiltered|uncensored)\b",
+    ]),
+    re.IGNORECASE,
+)
+
+
+def classify(user_text: str) -> Optional[str]:
+    """BENIGN, INJECTION, or None when the models need to decide."""
+    if _INJECTION_RE.search(user_text):
+        return INJECTION
+    if len(user_text) <= 40 and _BENIGN_RE.match(user_text.strip()):
+        return BENIGN
+    return None
@@ -2,42 +2,53 @@
 
 from fastapi import Request
 from fastapi.responses import JSONResponse
-from time import time
-from collections import defaultdict
+from math import ceil
+from typing import Optional
+from app.core.client_ip import get_client_ip
 from app.core.monitor import monitor
+from app.core.shared_state import shared_state
 
-# A simple in-memory store: IP -> [timestamp1, timestamp2, ...]
-request_history = defaultdict(list)
-
+# Default limit: 10 requests per minute per IP (burst of 10, then 1 every 6s)
 LIMIT = 10          # Max requests
 WINDOW_SECONDS = 60 # Per minute
 
+# Per-route-prefix limits, first match wins: (prefix, max requests, per seconds).
+# Each prefix has its own token bucket per IP, so page-visit pings don't eat
+# the chat budget. Buckets live in the shared-state backend: constant state per
+# key, idle buckets swept out, and (with SHARED_STATE_BACKEND=sqlite) one
+# limit across all uvicorn workers instead of one per worker.
+ROUTE_LIMITS = (
+    ("/api/v1/chat", LIMIT, WINDOW_SECONDS),  # /chat and /chat/stream
+    ("/api/v1/feedback", 5, WINDOW_SECONDS),
+    ("/api/v1/visit", 30, WINDOW_SECONDS),
+)
+
 # Paths exempt from rate limiting (admin dashboard polling, health checks)
-EXEMPT_PREFIXES = ("/health", "/db-test", "/api/v1/admin")
+EXEMPT_PREFIXES = ("/health", "/ready", "/db-test", "/api/v1/admin")
+
+def _route_limit(path: str):
+    for prefix, limit, window in ROUTE_LIMITS:
+        if path.startswith(prefix):
+            return prefix, limit, window
+    return "*", LIMIT, WINDOW_SECONDS
 
-async def rate_limit_middleware(request: Request, call_next):
+
+def check_rate_limit(request: Request) -> Optional[JSONResponse]:
+    """429 if the client's bucket for this route is empty, else None."""
     # Skip rate limiting for admin & health routes
     path = request.url.path
     if any(path.startswith(prefix) for prefix in EXEMPT_PREFIXES):
-        return await call_next(request)
-
-    client_ip = request.client.host
-    now = time()
-    
-    # 1. Clean up old requests (older than 60s)
-    # This is RAM-only, cleaning logic happens here
-    request_history[client_ip] = [t for t in request_history[client_ip] if now - t < WINDOW_SECONDS]
-    
-    # 2. Check Limit
-    if len(request_history[client_ip]) >= LIMIT:
+        return None
+
+    client_ip = get_client_ip(request)
+    prefix, limit, window = _route_limit(path)
+
+    retry_after = shared_state.take_token(f"ratelimit:{prefix}:{client_ip}", limit, window)
+    if retry_after:
         monitor.log_security_event("RATE_LIMIT", f"IP {client_ip} blocked", client_ip=client_ip)
         return JSONResponse(
             status_code=429,
-            content={"detail": "Too many requests. Please slow down."}
+            content={"detail": "Too many requests. Please slow down."},
+            headers={"Retry-After": str(ceil(retry_after))},
         )
-    
-    # 3. Add current request
-    request_history[client_ip].append(now)
-    
-    response = await call_next(request)
-    return response
\ No newline at end of file
+    return None
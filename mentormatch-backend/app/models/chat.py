@@ -85,6 +85,11 @@ class SecurityEvent(Base):
     detail = Column(Text, nullable=True)
     client_ip = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    # Repeats of the same (event_type, client_ip) inside the aggregation window
+    # are folded into one row: event_count occurrences between first/last seen.
+    event_count = Column(Integer, nullable=False, default=1, server_default="1")
+    first_seen_at = Column(DateTime(timezone=True), nullable=True)
+    last_seen_at = Column(DateTime(timezone=True), nullable=True, index=True)
 
 
 class TrafficMetric(Base):
@@ -1,9 +1,10 @@
 # FILE: app/schemas/admin.py
 
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from pydantic import EmailStr
+from app.core.client_ip import normalize_ip
 
 # --- PILLAR 1: TRAFFIC & USAGE ---
 class TrafficStats(BaseModel):
@@ -14,6 +15,9 @@ class TrafficStats(BaseModel):
     requests_per_minute_peak: int
     average_latency_ms: float
     total_tokens_processed: int # Estimate
+    latency_p50_ms: float = 0.0  # Rolling 5-minute window
+    latency_p95_ms: float = 0.0
+    latency_p99_ms: float = 0.0
 
 # --- PILLAR 2: SECURITY (THE IRON DOME) ---
 class SecurityStats(BaseModel):
@@ -37,6 +41,11 @@ class ProcessInfo(BaseModel):
     cpu_percent: float
     memory_percent: float
 
+class CacheStats(BaseModel):
+    hits: int
+    misses: int
+    hit_rate: float  # Percentage of lookups served from cache
+
 # --- PILLAR 3: SYSTEM HEALTH ---
 class SystemHealth(BaseModel):
     cpu_usage_percent: float
@@ -67,6 +76,7 @@ class SuperAdminDashboard(BaseModel):
     security: SecurityStats
     system: SystemHealth
     business: BusinessStats
+    caches: Dict[str, CacheStats] = {}  # Answer, history and verdict caches
     recent_security_logs: List[str] # "IP 1.2.3.4 blocked for SQLi"
 
 # --- AUTH SCHEMAS ---
@@ -99,6 +109,17 @@ class FeedbackListResponse(BaseModel):
     page: int
     page_size: int
 
+# --- IP JAIL ---
+class IPBanRequest(BaseModel):
+    ip: str
+    duration_seconds: int = 3600
+
+    @field_validator("ip")
+    @classmethod
+    def _valid_ip(cls, value: str) -> str:
+        # Normalized, so "::0001" and "::1" are the same jail key
+        return normalize_ip(value)
+
 # --- DB MANAGER SCHEMAS ---
 class DBQueryRequest(BaseModel):
     query: str # Raw SQL (Read-Only enforced)
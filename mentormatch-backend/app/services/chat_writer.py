@@ -0,0 +1,215 @@
+# FILE: app/services/chat_writer.py
+
+import time
+import asyncio
+from typing import Optional
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.chat import ChatSession, ChatMessage
+
+_STOP = object()  # Sentinel: drain and exit
+_RETRY_DELAY_SECONDS = 0.5
+
+
+class ChatWriteBehind:
+    """Write-behind persistence for chat sessions and messages.
+
+    The request path only enqueues rows (O(1), no DB round trip). A single
+    background task drains the bounded queue and bulk-inserts everything it
+    collected every CHAT_WRITE_BEHIND_FLUSH_MS or CHAT_WRITE_BEHIND_BATCH_ROWS
+    rows, whichever comes first — one multi-row INSERT per table per batch.
+
+    When the queue is full (or the writer isn't running) `enqueue_*` returns
+    False and the caller falls back to a synchronous write — or, for a turn
+    whose session row is itself still queued, waits for room (`put_messages`),
+    since a direct insert would fail its foreign key.
+
+    A failed batch is retried once, then split into its queue items (one
+    session, or one turn's messages) and inserted item by item, so a bad row
+    only loses itself. Items that still fail are logged and dropped; a lost
+    session is forgotten so follow-up turns get a 404. A session counts as
+    pending until its row has committed. `stop()` flushes whatever is still
+    queued (lifespan shutdown).
+
+    Pending sessions are tracked per process, so write-behind only runs with
+    a single worker: under SHARED_STATE_BACKEND != "memory" (several workers)
+    a follow-up could reach a worker that has never heard of its session,
+    and every write stays synchronous instead.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Sessions queued but not yet committed — they exist as far as the API is concerned
+        self._pending_sessions: set = set()
+        self.written_rows = 0
+        self.dropped_rows = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the flusher on the running event loop (call from lifespan startup)."""
+        if not settings.CHAT_WRITE_BEHIND_ENABLED or self.running:
+            return
+        if settings.SHARED_STATE_BACKEND != "memory":
+            print("[WRITER] Chat write-behind disabled: pending sessions are per-process and "
+                  f"SHARED_STATE_BACKEND={settings.SHARED_STATE_BACKEND!r} implies several workers")
+            return
+        self._queue = asyncio.Queue(maxsize=settings.CHAT_WRITE_BEHIND_MAX_QUEUE)
+        self._task = asyncio.create_task(self._run())
+        print("[WRITER] Chat write-behind enabled "
+              f"(flush every {settings.CHAT_WRITE_BEHIND_FLUSH_MS}ms / {settings.CHAT_WRITE_BEHIND_BATCH_ROWS} rows)")
+
+    async def stop(self):
+        """Flush everything still queued, then stop the flusher."""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    # ------------------------------------------------------------------
+    # Request path
+    # ------------------------------------------------------------------
+
+    def _offer(self, item) -> bool:
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def enqueue_session(self, session_id, client_ip: str) -> bool:
+        row = {"id": session_id, "client_ip": client_ip}
+        if self._offer(("session", [row])):
+            self._pending_sessions.add(session_id)
+            return True
+        return False
+
+    def enqueue_messages(self, rows: list) -> bool:
+        return self._offer(("messages", rows))
+
+    async def put_messages(self, rows: list):
+        """Queue rows, waiting for room if the queue is full."""
+        await self._queue.put(("messages", rows))
+
+    def is_pending_session(self, session_id) -> bool:
+        return session_id in self._pending_sessions
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": settings.CHAT_WRITE_BEHIND_MAX_QUEUE,
+            "pending_sessions": len(self._pending_sessions),
+            "written_rows": self.written_rows,
+            "dropped_rows": self.dropped_rows,
+        }
+
+    # ------------------------------------------------------------------
+    # Background flusher
+    # ------------------------------------------------------------------
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        interval = settings.CHAT_WRITE_BEHIND_FLUSH_MS / 1000
+        max_rows = settings.CHAT_WRITE_BEHIND_BATCH_ROWS
+        stopping = False
+
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+
+            # Collect until the batch is full or the flush interval elapses
+            batch = [item]
+            rows = len(item[1])
+            deadline = loop.time() + interval
+            while rows < max_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                rows += len(item[1])
+
+            await self._flush_batch(batch)
+
+        # Durable shutdown: anything enqueued after the sentinel
+        leftover = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                leftover.append(item)
+        if leftover:
+            await self._flush_batch(leftover)
+
+    async def _flush_batch(self, batch: list):
+        lost = await run_in_threadpool(self._flush, batch)
+        # Only now (committed, or given up on) do queued sessions stop being "pending"
+        for kind, rows in batch:
+            if kind == "session":
+                for row in rows:
+                    self._pending_sessions.discard(row["id"])
+        if lost:
+            from app.services.chatvat import chatvat_service
+            for session_id in lost:
+                chatvat_service.forget_session(session_id)
+
+    def _insert(self, batch: list):
+        """Bulk-insert queue items in one transaction. Sessions go first so message FKs resolve."""
+        sessions = [row for kind, rows in batch if kind == "session" for row in rows]
+        messages = [row for kind, rows in batch if kind == "messages" for row in rows]
+
+        db = SessionLocal()
+        try:
+            if sessions:
+                db.execute(ChatSession.__table__.insert(), sessions)
+            if messages:
+                db.execute(ChatMessage.__table__.insert(), messages)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _flush(self, batch: list) -> list:
+        """Persist one batch (blocking). Returns the ids of sessions that could not be written."""
+        for attempt in range(2):
+            try:
+                self._insert(batch)
+                self.written_rows += sum(len(rows) for _, rows in batch)
+                return []
+            except Exception as e:
+                print(f"[WRITER] Batch flush failed (attempt {attempt + 1}): {e}")
+                if attempt == 0:
+                    time.sleep(_RETRY_DELAY_SECONDS)
+
+        # Split: queue order keeps every session ahead of its messages
+        lost = []
+        for kind, rows in batch:
+            try:
+                self._insert([(kind, rows)])
+                self.written_rows += len(rows)
+            except Exception as e:
+                self.dropped_rows += len(rows)
+                print(f"[WRITER] Dropped {len(rows)} {kind} row(s): {e}")
+                if kind == "session":
+                    lost.extend(row["id"] for row in rows)
+        return lost
+
+
+# Global Singleton Instance
+chat_writer = ChatWriteBehind()
@@ -1,12 +1,27 @@
 # FILE: app/services/chatvat.py
 
-import requests
-import time
+import re
+import asyncio
+import json
+import httpx
+from typing import AsyncIterator, Optional
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from app.core.config import settings
 from app.models.chat import ChatMessage
 from app.core.monitor import monitor
+from app.core.cache import TTLCache
+from app.core.deadline import Deadline, remaining_or
+from app.services.circuit_breaker import RetryBudget, backoff_delay
+from app.services.load_balancer import BackendPool, ChatVatBackend
+from app.services.dispatcher import FairDispatcher
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def _normalize_question(text: str) -> str:
+    """Case/whitespace/trailing-punctuation-insensitive form used as a cache key."""
+    return _WHITESPACE_RE.sub(" ", text).strip().casefold().rstrip("?!. ")
 
 class ChatVatService:
     # ── Token budget for conversation history ──
@@ -18,6 +33,78 @@ class ChatVatService:
     MAX_HISTORY_MESSAGES = 3
     MAX_HISTORY_CHARS = 2000        # ≈ 500 tokens
 
+    # Replies we never want to serve from cache
+    EMPTY_REPLY = "Error: Empty response from AI"
+
+    def __init__(self):
+        # One shared async client per process → persistent keep-alive
+        # connections to every ChatVat replica instead of a fresh TCP
+        # handshake per call. Created lazily so it binds to the running loop.
+        self._client: Optional[httpx.AsyncClient] = None
+
+        # Answer cache for first-turn questions (see `_answer_cache_key`)
+        self._answer_cache = TTLCache(
+            max_entries=settings.CHATVAT_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.CHATVAT_CACHE_TTL_SECONDS,
+        )
+
+        # Single-flight: final payload text -> the in-flight upstream call.
+        # Identical concurrent requests await the same task instead of
+        # each hitting ChatVat. Entries live only while the call is running.
+        self._inflight: dict = {}
+
+        # ChatVat replicas, least-outstanding-requests. Each has its own circuit
+        # breaker: failing replicas are ejected, and we fail fast only when
+        # every replica is down instead of burning a timeout per request.
+        self._pool = BackendPool(
+            settings.CHATVAT_ENGINE_URLS,
+            failure_threshold=settings.CHATVAT_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout_seconds=settings.CHATVAT_BREAKER_RESET_SECONDS,
+        )
+        self._retry_budget = RetryBudget(ratio=settings.CHATVAT_RETRY_BUDGET_RATIO)
+
+        # Admission control: at most CHATVAT_MAX_CONCURRENCY upstream calls,
+        # the rest queue round-robin per IP, then per session, with a bounded wait.
+        self._dispatcher = FairDispatcher(
+            max_concurrency=settings.CHATVAT_MAX_CONCURRENCY,
+            max_queue=settings.CHATVAT_MAX_QUEUE,
+            max_wait_seconds=settings.CHATVAT_QUEUE_TIMEOUT_SECONDS,
+        )
+
+        # session_id -> last MAX_HISTORY_MESSAGES (role, content) pairs.
+        # Kept current on the write path so follow-ups skip the history query.
+        # Per process, so only safe when this is the only worker.
+        self._history_cache_enabled = settings.CHAT_HISTORY_CACHE_ENABLED
+        if self._history_cache_enabled and settings.SHARED_STATE_BACKEND != "memory":
+            print("[CHATVAT] History cache disabled: it is per-process and "
+                  f"SHARED_STATE_BACKEND={settings.SHARED_STATE_BACKEND!r} implies several workers")
+            self._history_cache_enabled = False
+        self._history_cache = TTLCache(
+            max_entries=settings.CHAT_HISTORY_CACHE_SESSIONS,
+            ttl_seconds=settings.CHAT_HISTORY_CACHE_TTL_SECONDS,
+        )
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(
+                    settings.CHATVAT_TIMEOUT_SECONDS,
+                    connect=settings.CHATVAT_CONNECT_TIMEOUT_SECONDS,
+                ),
+                limits=httpx.Limits(
+                    max_connections=settings.CHATVAT_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.CHATVAT_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.CHATVAT_KEEPALIVE_EXPIRY_SECONDS,
+                ),
+            )
+        return self._client
+
+    async def aclose(self):
+        """Close the connection pool (call on shutdown)."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
     @staticmethod
     def _trim_history(history_text: str, max_chars: int) -> str:
         """Trim history from the *start* (oldest messages) to fit budget."""
@@ -31,23 +118,130 @@ class ChatVatService:
             trimmed = trimmed[nl + 1:]
         return f"[...earlier context trimmed...]\n{trimmed}"
 
-    def ask(self, user_message: str, session_id: str, db: Session) -> str:
+    def _load_recent_messages(self, session_id: str, db: Session) -> tuple:
+        """Last 3 messages of the session, oldest first, as (role, content) pairs (blocking DB call)."""
+        previous_msgs = db.query(ChatMessage).filter(
+            ChatMessage.session_id == session_id
+        ).order_by(ChatMessage.created_at.desc()).limit(self.MAX_HISTORY_MESSAGES).all()
+        return tuple((msg.role, msg.content) for msg in reversed(previous_msgs))
+
+    def _format_history(self, messages: tuple) -> str:
+        history_text = ""
+        for role, content in messages:
+            role_label = "User" if role == "user" else "Assistant"
+            history_text += f"{role_label}: {content}\n"
+
+        # Enforce token budget
+        return self._trim_history(history_text, self.MAX_HISTORY_CHARS)
+
+    # ------------------------------------------------------------------
+    # Per-session history cache
+    # ------------------------------------------------------------------
+
+    async def _recent_messages(self, session_id: str, db: Session, deadline: Optional[Deadline] = None) -> tuple:
+        """Recent messages from the in-process cache, falling back to Postgres on a miss."""
+        key = str(session_id)
+        if self._history_cache_enabled:
+            cached = self._history_cache.get(key)
+            monitor.log_cache_lookup("chat_history", cached is not None)
+            if cached is not None:
+                return cached
+
+        # The SQLAlchemy session is synchronous — keep it off the event loop.
+        if deadline is None:
+            messages = await run_in_threadpool(self._load_recent_messages, session_id, db)
+        else:
+            deadline.check("history fetch")
+            try:
+                messages = await asyncio.wait_for(
+                    run_in_threadpool(self._load_recent_messages, session_id, db),
+                    deadline.remaining(),
+                )
+            except asyncio.TimeoutError:
+                raise deadline.exceeded("history fetch")
+        if self._history_cache_enabled:
+            self._history_cache.set(key, messages)
+        return messages
+
+    def start_history(self, session_id):
+        """Seed an empty history for a session we just created (nothing to load)."""
+        if self._history_cache_enabled:
+            self._history_cache.set(str(session_id), ())
+
+    def remember_turn(self, session_id, user_text: str, ai_text: str):
+        """Append a persisted user/assistant pair to the cached history.
+
+        Call only after the DB commit succeeded. Sessions that aren't cached
+        are left alone — their next read loads the full history from the DB.
+        """
+        if not self._history_cache_enabled:
+            return
+        key = str(session_id)
+        cached = self._history_cache.get(key)
+        if cached is None:
+            return
+        messages = cached + (("user", user_text), ("assistant", ai_text))
+        self._history_cache.set(key, messages[-self.MAX_HISTORY_MESSAGES:])
+
+    def forget_session(self, session_id):
+        """Drop a session's cached history (its row never reached the DB)."""
+        self._history_cache.pop(str(session_id))
+
+    def knows_session(self, session_id) -> bool:
+        """True if the session is in the history cache (so it exists in the DB)."""
+        return self._history_cache_enabled and self._history_cache.get(str(session_id)) is not None
+
+    async def _post_chat(self, backend: ChatVatBackend, payload: dict, timeout: float) -> str:
+        # `timeout` bounds the whole call (httpx timeouts are per socket op)
+        try:
+            with self._pool.track(backend):
+                response = await asyncio.wait_for(
+                    self._get_client().post(f"{backend.url}/chat", json=payload),
+                    timeout,
+                )
+        except asyncio.TimeoutError:
+            raise httpx.TimeoutException(f"ChatVat did not answer within {timeout:.1f}s")
+        response.raise_for_status()
+        try:
+            return response.json().get("message", self.EMPTY_REPLY)
+        except (ValueError, AttributeError) as e:
+            # A 200 that isn't a JSON object (proxy error page, ...) is an upstream failure too
+            raise httpx.DecodingError(f"Malformed JSON reply from ChatVat: {e}", request=response.request)
+
+    # ------------------------------------------------------------------
+    # Answer cache
+    # ------------------------------------------------------------------
+
+    def _answer_cache_key(self, payload: dict, user_message: str) -> Optional[str]:
+        """Cache key for the payload, or None if it must not be cached.
+
+        Only history-less prompts are cacheable: for those `build_payload`
+        sends the bare question, so the payload equals the user's message.
+        """
+        if not settings.CHATVAT_CACHE_ENABLED or payload["message"] != user_message:
+            return None
+        return _normalize_question(user_message)
+
+    def _cache_lookup(self, cache_key: Optional[str]) -> Optional[str]:
+        if cache_key is None:
+            return None
+        answer = self._answer_cache.get(cache_key)
+        monitor.log_cache_lookup("chatvat_answers", answer is not None)
+        return answer
+
+    def _cache_store(self, cache_key: Optional[str], answer: str):
+        if cache_key is not None and answer and answer != self.EMPTY_REPLY:
+            self._answer_cache.set(cache_key, answer)
+
+    async def build_payload(self, user_message: str, session_id: str, db: Session,
+                            deadline: Optional[Deadline] = None) -> dict:
         """
         Orchestrates the 'Context Injection' while respecting the 'message' schema.
         """
         # 1. Fetch History (Last 3 Messages, token-trimmed)
         history_text = ""
         if session_id:
-            previous_msgs = db.query(ChatMessage).filter(
-                ChatMessage.session_id == session_id
-            ).order_by(ChatMessage.created_at.desc()).limit(self.MAX_HISTORY_MESSAGES).all()
-            
-            for msg in reversed(previous_msgs):
-                role_label = "User" if msg.role == "user" else "Assistant"
-                history_text += f"{role_label}: {msg.content}\n"
-
-            # Enforce token budget
-            history_text = self._trim_history(history_text, self.MAX_HISTORY_CHARS)
+            history_text = self._format_history(await self._recent_messages(session_id, db, deadline))
 
         # 2. Construct the Payload Content
         # Only include history block when there's actual prior context.
@@ -60,30 +254,291 @@ class ChatVatService:
             # First message — send only the user query, no wrapper noise
             final_payload_content = user_message
 
-        # 3. Send to ChatVat with RETRY LOGIC
-        url = f"{settings.CHATVAT_ENGINE_URL}/chat"
-        payload = {"message": final_payload_content}
+        return {"message": final_payload_content}
+
+    async def ask(self, user_message: str, session_id: str, db: Session, client_key: tuple = None,
+                  deadline: Optional[Deadline] = None) -> str:
+        """Buffered mode: returns the full ChatVat reply.
+
+        `client_key` — (client IP, session id) — is what the admission queue
+        schedules fairly on; it defaults to the session alone. `deadline`
+        bounds the history fetch, the queue wait and every ChatVat attempt.
+        """
+        payload = await self.build_payload(user_message, session_id, db, deadline)
+
+        # 3. Serve common first-turn questions from cache
+        cache_key = self._answer_cache_key(payload, user_message)
+        cached = self._cache_lookup(cache_key)
+        if cached is not None:
+            return cached
+
+        answer = await self._send_coalesced(payload, client_key or (str(session_id), str(session_id)), deadline)
+        self._cache_store(cache_key, answer)
+        return answer
+
+    async def _send_coalesced(self, payload: dict, client_key: tuple, deadline: Optional[Deadline]) -> str:
+        """Share one upstream call between concurrent identical payloads.
+
+        The call runs under the first caller's deadline; each follower still
+        stops waiting when its own deadline runs out.
+        """
+        key = payload["message"]
+        task = self._inflight.get(key)
+        monitor.log_cache_lookup("chatvat_coalesced", task is not None)
+
+        if task is None:
+            task = asyncio.ensure_future(self._send_admitted(payload, client_key, deadline))
+            self._inflight[key] = task
+
+            def _done(t: asyncio.Task):
+                if self._inflight.get(key) is t:
+                    del self._inflight[key]
+                # Mark the exception as retrieved even if every waiter left
+                if not t.cancelled():
+                    t.exception()
+
+            task.add_done_callback(_done)
 
+        # shield(): one client disconnecting (or timing out) must not cancel
+        # the call the other waiters are sharing.
+        if deadline is None:
+            return await asyncio.shield(task)
         try:
-            # ATTEMPT 1
-            response = requests.post(url, json=payload, timeout=45)
+            return await asyncio.wait_for(asyncio.shield(task), deadline.remaining())
+        except asyncio.TimeoutError:
+            raise deadline.exceeded("ChatVat (shared call)")
+
+    async def _send_admitted(self, payload: dict, client_key: tuple, deadline: Optional[Deadline]) -> str:
+        """Wait for an upstream slot (fair across clients), then send."""
+        async with self._dispatcher.slot(client_key, max_wait=remaining_or(deadline, self._dispatcher.max_wait_seconds)):
+            return await self._send_with_retry(payload, deadline)
+
+    async def _send_with_retry(self, payload: dict, deadline: Optional[Deadline] = None) -> str:
+        # 4. Send to ChatVat through the circuit breaker, retrying with
+        #    jittered exponential backoff while the retry budget allows.
+        self._retry_budget.deposit()
+        attempts = settings.CHATVAT_RETRY_ATTEMPTS + 1
+        last_error = None
+
+        backend = None
+
+        for attempt in range(attempts):
+            if deadline is not None:
+                deadline.check("ChatVat attempt")
+            # Retries prefer a different replica than the one that just failed
+            backend = self._acquire_backend(exclude=backend)
+            try:
+                timeout = remaining_or(deadline, settings.CHATVAT_TIMEOUT_SECONDS)
+                answer = await self._post_chat(backend, payload, timeout)
+                self._record_outcome(backend, None)
+                return answer
+            except httpx.HTTPError as e:
+                self._record_outcome(backend, e)
+                last_error = e
+                if not self._should_retry(e, attempt, attempts):
+                    break
+                delay = self._backoff(attempt)
+                if not self._has_time_for_retry(deadline, delay):
+                    break
+                monitor.log_security_event("SYSTEM_WARNING", f"ChatVat glitch. Retrying... ({str(e)})")
+                await asyncio.sleep(delay)
+
+        # FINAL FAIL: Log and explode
+        monitor.log_security_event("SYSTEM_ERROR", f"ChatVat Died after Retry: {str(last_error)}")
+        if deadline is not None and deadline.remaining() < settings.CHATVAT_RETRY_MIN_REMAINING_SECONDS:
+            raise deadline.exceeded("ChatVat")
+        raise last_error # Triggers global_exception_handler
+
+    # ------------------------------------------------------------------
+    # Circuit breaker / retry policy
+    # ------------------------------------------------------------------
+
+    def is_available(self) -> bool:
+        """Is the ChatVat engine believed healthy? (False while every replica is ejected)"""
+        return self._pool.is_available()
+
+    def ensure_available(self):
+        """Fail fast with a 503 while every replica is ejected (does not use up a probe)."""
+        if not self._pool.is_available():
+            raise self._circuit_open_error()
+
+    def _acquire_backend(self, exclude: Optional[ChatVatBackend] = None) -> ChatVatBackend:
+        """Pick a replica for one upstream call (claims its probe when half-open)."""
+        backend = self._pool.pick(exclude=exclude)
+        if backend is None:
+            raise self._circuit_open_error()
+        return backend
+
+    def _circuit_open_error(self) -> HTTPException:
+        retry_after = max(1, int(self._pool.retry_after()))
+        return HTTPException(
+            status_code=503,
+            detail="Our AI mentor is currently napping. Please try again shortly.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    def backend_stats(self) -> list:
+        """Per-replica state, in-flight calls, request/error counts and average latency."""
+        return self._pool.stats()
+
+    def dispatcher_stats(self) -> dict:
+        """Admission queue: active slots, queued callers, early rejections."""
+        return self._dispatcher.stats()
+
+    @staticmethod
+    def _is_backend_failure(error: httpx.HTTPError) -> bool:
+        """Transport errors and 5xx mean ChatVat is unhealthy; 4xx means we sent something bad."""
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500
+        return True
+
+    def _record_outcome(self, backend: ChatVatBackend, error: Optional[httpx.HTTPError]):
+        if error is None or not self._is_backend_failure(error):
+            if backend.breaker.record_success():
+                monitor.log_security_event("SYSTEM_INFO", f"ChatVat {backend.url} recovered — back in rotation")
+            return
+
+        backend.total_errors += 1
+        backend.last_error = str(error)
+        if backend.breaker.record_failure():
+            monitor.log_security_event(
+                "SYSTEM_ERROR",
+                f"ChatVat {backend.url} ejected — circuit OPEN for {settings.CHATVAT_BREAKER_RESET_SECONDS:.0f}s",
+            )
+
+    def _should_retry(self, error: httpx.HTTPError, attempt: int, attempts: int) -> bool:
+        return (
+            attempt + 1 < attempts
+            and self._is_backend_failure(error)
+            and self._pool.is_available()
+            and self._retry_budget.try_spend()
+        )
+
+    @staticmethod
+    def _has_time_for_retry(deadline: Optional[Deadline], delay: float) -> bool:
+        """Skip retries the request budget can't pay for."""
+        return deadline is None or deadline.remaining() - delay >= settings.CHATVAT_RETRY_MIN_REMAINING_SECONDS
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return backoff_delay(
+            attempt,
+            settings.CHATVAT_RETRY_BASE_DELAY_SECONDS,
+            settings.CHATVAT_RETRY_MAX_DELAY_SECONDS,
+        )
+
+    # ------------------------------------------------------------------
+    # Chunked (streaming) mode
+    # ------------------------------------------------------------------
+
+    async def _iter_stream(self, backend: ChatVatBackend, payload: dict, timeout: float) -> AsyncIterator[str]:
+        """Yield text chunks from ChatVat's streaming endpoint as they arrive.
+
+        Understands three upstream shapes:
+          * text/event-stream  → each `data:` line is one chunk
+          * application/json   → non-streaming fallback, one chunk
+          * anything else      → raw chunked text, forwarded as-is
+
+        `timeout` applies per socket operation (connect, each read), so a
+        reply that keeps producing chunks is never cut off.
+        """
+        url = f"{backend.url}{settings.CHATVAT_STREAM_PATH}"
+        with self._pool.track(backend):
+            async for chunk in self._read_stream(url, payload, timeout):
+                yield chunk
+
+    async def _read_stream(self, url: str, payload: dict, timeout: float) -> AsyncIterator[str]:
+        request_timeout = httpx.Timeout(timeout, connect=min(timeout, settings.CHATVAT_CONNECT_TIMEOUT_SECONDS))
+        async with self._get_client().stream("POST", url, json=payload, timeout=request_timeout) as response:
             response.raise_for_status()
-            return response.json().get("message", "Error: Empty response from AI")
+            content_type = response.headers.get("content-type", "")
+
+            if content_type.startswith("application/json"):
+                body = await response.aread()
+                try:
+                    message = json.loads(body).get("message", self.EMPTY_REPLY)
+                except (ValueError, AttributeError) as e:
+                    # Same path as any other upstream failure (breaker, retry, error frame)
+                    raise httpx.DecodingError(f"Malformed JSON reply from ChatVat: {e}", request=response.request)
+                yield message
+
+            elif content_type.startswith("text/event-stream"):
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].removeprefix(" ")
+                    if data == "[DONE]":
+                        break
+                    if data:
+                        yield data
 
-        except requests.exceptions.RequestException as e:
-            # SOTA REQUIREMENT: Retry once internally
-            monitor.log_security_event("SYSTEM_WARNING", f"ChatVat glitch. Retrying... ({str(e)})")
-            time.sleep(0.5) # Brief cool-down
-            
+            else:
+                async for chunk in response.aiter_text():
+                    if chunk:
+                        yield chunk
+
+    async def ask_stream(self, payload: dict, user_message: str, client_key: tuple,
+                         deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+        """Streaming mode: yields reply chunks as ChatVat produces them.
+
+        The stream holds one admission slot for as long as it runs. The
+        deadline bounds the queue wait and time-to-first-chunk; once chunks
+        are flowing the client can see progress, so the stream isn't cut.
+
+        A cached first-turn answer is sent as a single chunk; a fully
+        streamed one is stored for next time.
+        """
+        cache_key = self._answer_cache_key(payload, user_message)
+        cached = self._cache_lookup(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        async with self._dispatcher.slot(client_key, max_wait=remaining_or(deadline, self._dispatcher.max_wait_seconds)):
+            async for chunk in self._stream_with_retry(payload, deadline):
+                chunks.append(chunk)
+                yield chunk
+        self._cache_store(cache_key, "".join(chunks))
+
+    async def _stream_with_retry(self, payload: dict, deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+        """Same breaker/retry policy as `_send_with_retry`, but retries only
+        while nothing has been sent yet — once the first chunk is out we
+        can't take it back.
+        """
+        self._retry_budget.deposit()
+        attempts = settings.CHATVAT_RETRY_ATTEMPTS + 1
+        last_error = None
+
+        backend = None
+
+        for attempt in range(attempts):
+            if deadline is not None:
+                deadline.check("ChatVat stream attempt")
+            backend = self._acquire_backend(exclude=backend)
+            started = False
             try:
-                # ATTEMPT 2
-                response = requests.post(url, json=payload, timeout=45)
-                response.raise_for_status()
-                return response.json().get("message", "Error: Empty response from AI")
-            
-            except requests.exceptions.RequestException as final_error:
-                # FINAL FAIL: Log and explode
-                monitor.log_security_event("SYSTEM_ERROR", f"ChatVat Died after Retry: {str(final_error)}")
-                raise final_error # Triggers global_exception_handler
-
-chatvat_service = ChatVatService()
\ No newline at end of file
+                timeout = remaining_or(deadline, settings.CHATVAT_TIMEOUT_SECONDS)
+                async for chunk in self._iter_stream(backend, payload, timeout):
+                    started = True
+                    yield chunk
+                self._record_outcome(backend, None)
+                return
+            except httpx.HTTPError as e:
+                self._record_outcome(backend, e)
+                last_error = e
+                if started:
+                    monitor.log_security_event("SYSTEM_ERROR", f"ChatVat stream broke mid-reply: {str(e)}")
+                    raise
+                if not self._should_retry(e, attempt, attempts):
+                    break
+                delay = self._backoff(attempt)
+                if not self._has_time_for_retry(deadline, delay):
+                    break
+                monitor.log_security_event("SYSTEM_WARNING", f"ChatVat glitch. Retrying... ({str(e)})")
+                await asyncio.sleep(delay)
+
+        monitor.log_security_event("SYSTEM_ERROR", f"ChatVat Died after Retry: {str(last_error)}")
+        raise last_error
+
+chatvat_service = ChatVatService()
@@ -0,0 +1,138 @@
+# FILE: app/services/circuit_breaker.py
+
+import time
+import random
+import threading
+
+
+class CircuitBreaker:
+    """Classic three-state circuit breaker.
+
+    CLOSED     → calls flow normally; consecutive failures are counted.
+    OPEN       → calls fail fast until `reset_timeout_seconds` has passed.
+    HALF_OPEN  → a single probe call is let through; success closes the
+                 circuit, failure re-opens it for another full timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at = None   # set while a half-open probe is in flight
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # State
+    # ------------------------------------------------------------------
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        # OPEN decays to HALF_OPEN on read once the timeout has elapsed
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout_seconds:
+            self._state = self.HALF_OPEN
+            self._probe_started_at = None
+        return self._state
+
+    def is_available(self) -> bool:
+        """False only while the circuit is fully open."""
+        return self.state != self.OPEN
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe will be allowed (0 if not open)."""
+        with self._lock:
+            if self._current_state(time.monotonic()) != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout_seconds - (time.monotonic() - self._opened_at))
+
+    # ------------------------------------------------------------------
+    # Call accounting
+    # ------------------------------------------------------------------
+
+    def allow_request(self) -> bool:
+        """Ask permission before each upstream call."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            if state == self.CLOSED:
+                return True
+            if state == self.OPEN:
+                return False
+            # HALF_OPEN: one probe at a time. A probe that never reported
+            # back (e.g. cancelled) is considered lost after the timeout.
+            if self._probe_started_at is None or now - self._probe_started_at >= self.reset_timeout_seconds:
+                self._probe_started_at = now
+                return True
+            return False
+
+    def record_success(self) -> bool:
+        """Returns True if this success closed a previously tripped circuit."""
+        with self._lock:
+            recovered = self._state != self.CLOSED
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._probe_started_at = None
+            return recovered
+
+    def record_failure(self) -> bool:
+        """Returns True if this failure tripped the circuit open."""
+        with self._lock:
+            now = time.monotonic()
+            self._consecutive_failures += 1
+            was_open = self._state == self.OPEN
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = now
+                self._probe_started_at = None
+            return self._state == self.OPEN and not was_open
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self._current_state(time.monotonic()),
+                "consecutive_failures": self._consecutive_failures,
+            }
+
+
+class RetryBudget:
+    """Caps retries to a fraction of overall traffic.
+
+    Every call deposits `ratio` tokens and every retry spends one, so during
+    a full outage retries add at most ~`ratio` extra load on the backend
+    instead of multiplying it. `min_tokens` keeps a few retries available
+    at low traffic.
+    """
+
+    def __init__(self, ratio: float, min_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max(min_tokens, 1.0)
+        self._tokens = self.max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+def backoff_delay(attempt: int, base_seconds: float, max_seconds: float) -> float:
+    """Exponential backoff with full jitter: uniform(0, min(max, base * 2^attempt))."""
+    return random.uniform(0, min(max_seconds, base_seconds * (2 ** attempt)))
@@ -0,0 +1,122 @@
+# FILE: app/services/dispatcher.py
+
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+
+
+class FairDispatcher:
+    """Admission control in front of ChatVat.
+
+    At most `max_concurrency` upstream calls run at once. Everyone else waits
+    in a per-session FIFO, and freed slots are handed out round-robin on two
+    levels: across client IPs, then across the sessions behind each IP. One
+    noisy client with many tabs gets one turn per round, not a turn per
+    request, and students sharing a campus NAT still take turns with each
+    other. A caller that would wait longer than `max_wait_seconds` (or finds
+    `max_queue` callers already waiting) gets an early 503 instead of a slow
+    timeout.
+
+    Lives on the event loop, so the counters need no locking.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_wait_seconds: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+
+        self._active = 0
+        self._queued = 0
+        self._rejected = 0
+        # client -> (session -> deque of futures); dict order is the round-robin order
+        self._waiting: OrderedDict = OrderedDict()
+
+    @asynccontextmanager
+    async def slot(self, key: tuple, max_wait: float = None):
+        """Hold one upstream slot for the duration of the block.
+
+        `key` is the caller's (client IP, session id). `max_wait` shortens the queue wait (e.g. to the request's remaining deadline).
+        """
+        await self._acquire(key, self.max_wait_seconds if max_wait is None else min(max_wait, self.max_wait_seconds))
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, key: tuple, max_wait: float):
+        if self._active < self.max_concurrency and not self._waiting:
+            self._active += 1
+            return
+
+        if self._queued >= self.max_queue:
+            raise self._overloaded()
+
+        fut = asyncio.get_running_loop().create_future()
+        client, session = key
+        self._waiting.setdefault(client, OrderedDict()).setdefault(session, deque()).append(fut)
+        self._queued += 1
+
+        try:
+            # On success the releasing caller handed its slot straight to us
+            await asyncio.wait_for(fut, max_wait)
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                # Slot arrived just as we gave up — pass it on
+                self._release()
+            else:
+                self._discard(key, fut)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._overloaded()
+            raise
+
+    def _release(self):
+        # Hand the slot to the next session of the next client, round-robin
+        while self._waiting:
+            client, sessions = next(iter(self._waiting.items()))
+            session, queue = next(iter(sessions.items()))
+            fut = queue.popleft()
+            self._queued -= 1
+            if queue:
+                sessions.move_to_end(session)
+            else:
+                del sessions[session]
+            if sessions:
+                self._waiting.move_to_end(client)
+            else:
+                del self._waiting[client]
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._active -= 1
+
+    def _discard(self, key: tuple, fut: asyncio.Future):
+        client, session = key
+        sessions = self._waiting.get(client)
+        queue = sessions.get(session) if sessions is not None else None
+        if queue is None or fut not in queue:
+            return
+        queue.remove(fut)
+        self._queued -= 1
+        if not queue:
+            del sessions[session]
+            if not sessions:
+                del self._waiting[client]
+
+    def _overloaded(self) -> HTTPException:
+        self._rejected += 1
+        return HTTPException(
+            status_code=503,
+            detail="Our AI mentor is busy right now. Please try again in a few seconds.",
+            headers={"Retry-After": str(max(1, int(self.max_wait_seconds)))},
+        )
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "queued": self._queued,
+            "queued_clients": len(self._waiting),
+            "queued_sessions": sum(len(sessions) for sessions in self._waiting.values()),
+            "rejected": self._rejected,
+        }
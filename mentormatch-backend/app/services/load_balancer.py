@@ -0,0 +1,87 @@
+# FILE: app/services/load_balancer.py
+
+import time
+import random
+from contextlib import contextmanager
+from typing import Optional
+from app.services.circuit_breaker import CircuitBreaker
+
+
+class ChatVatBackend:
+    """One ChatVat replica: its own circuit breaker plus call statistics."""
+
+    def __init__(self, url: str, failure_threshold: int, reset_timeout_seconds: float):
+        self.url = url.rstrip("/")
+        # Per-backend breaker doubles as passive health ejection: a replica
+        # that keeps failing is taken out of rotation until a probe succeeds.
+        self.breaker = CircuitBreaker(
+            name=self.url,
+            failure_threshold=failure_threshold,
+            reset_timeout_seconds=reset_timeout_seconds,
+        )
+        self.outstanding = 0
+        self.total_requests = 0
+        self.total_errors = 0
+        self.total_latency_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    def snapshot(self) -> dict:
+        return {
+            "url": self.url,
+            "state": self.breaker.state,
+            "outstanding": self.outstanding,
+            "total_requests": self.total_requests,
+            "total_errors": self.total_errors,
+            "avg_latency_ms": round(self.total_latency_ms / self.total_requests, 2) if self.total_requests else 0,
+            "last_error": self.last_error,
+        }
+
+
+class BackendPool:
+    """Least-outstanding-requests balancer over ChatVat replicas.
+
+    Everything runs on the event loop, so the plain counters need no locking.
+    """
+
+    def __init__(self, urls: list, failure_threshold: int, reset_timeout_seconds: float):
+        self.backends = [
+            ChatVatBackend(url, failure_threshold, reset_timeout_seconds) for url in urls
+        ]
+
+    def is_available(self) -> bool:
+        """True while at least one backend is in rotation."""
+        return any(b.breaker.is_available() for b in self.backends)
+
+    def retry_after(self) -> float:
+        """Seconds until the first ejected backend may be probed again."""
+        return min(b.breaker.retry_after() for b in self.backends)
+
+    def pick(self, exclude: Optional[ChatVatBackend] = None) -> Optional[ChatVatBackend]:
+        """Backend with the fewest in-flight calls (random tie-break), or None if all are ejected.
+
+        `exclude` (the backend that just failed) is only used as a last resort.
+        """
+        candidates = sorted(
+            (b for b in self.backends if b.breaker.is_available()),
+            key=lambda b: (b is exclude, b.outstanding, random.random()),
+        )
+        for backend in candidates:
+            # Claims the single probe slot if the backend is half-open
+            if backend.breaker.allow_request():
+                return backend
+        return None
+
+    @contextmanager
+    def track(self, backend: ChatVatBackend):
+        """Count one in-flight call against `backend` and time it."""
+        backend.outstanding += 1
+        backend.total_requests += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            backend.outstanding -= 1
+            backend.total_latency_ms += (time.perf_counter() - start) * 1000
+
+    def stats(self) -> list:
+        return [b.snapshot() for b in self.backends]
@@ -0,0 +1,126 @@
+# FILE: scripts/bench_middleware.py
+#
+# Per-request overhead of the gateway middleware: the old chain of
+# @app.middleware("http") functions (BaseHTTPMiddleware) vs the single
+# pure-ASGI GatewayMiddleware. Both run the same checks in the same order
+# over an in-process ASGI transport, so only the middleware machinery differs.
+#
+#   cd mentormatch-backend
+#   python -m scripts.bench_middleware --requests 5000
+#
+# Needs the usual .env (app settings are imported). Rate limits are lifted
+# and DB flushing is disabled for the run.
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from app.core.monitor import monitor
+from app.middleware import rate_limiter
+from app.middleware.gateway import GatewayMiddleware
+from app.middleware.ip_jail import check_jail
+from app.middleware.rate_limiter import check_rate_limit
+from app.middleware.security import check_input
+
+
+def _base_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/bench")
+    def bench_get():
+        return {"ok": True}
+
+    @app.post("/bench")
+    async def bench_post(request: Request):
+        return {"received": len(await request.body())}
+
+    @app.get("/bench/stream")
+    def bench_stream():
+        return StreamingResponse((b"data: x\n\n" for _ in range(20)), media_type="text/event-stream")
+
+    return app
+
+
+def _legacy_app() -> FastAPI:
+    """The pre-gateway stack: one BaseHTTPMiddleware per concern."""
+    app = _base_app()
+
+    @app.middleware("http")
+    async def monitor_traffic_middleware(request: Request, call_next):
+        start_time = time.time()
+        response = await call_next(request)
+        monitor.log_request((time.time() - start_time) * 1000)
+        return response
+
+    @app.middleware("http")
+    async def sanitize_input_middleware(request: Request, call_next):
+        return await check_input(request) or await call_next(request)
+
+    @app.middleware("http")
+    async def rate_limit_middleware(request: Request, call_next):
+        return check_rate_limit(request) or await call_next(request)
+
+    @app.middleware("http")
+    async def jail_middleware(request: Request, call_next):
+        return check_jail(request) or await call_next(request)
+
+    return app
+
+
+def _gateway_app() -> FastAPI:
+    app = _base_app()
+    app.add_middleware(GatewayMiddleware)
+    return app
+
+
+async def _measure(app: FastAPI, method: str, path: str, n: int, **kwargs) -> list:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(50):  # warm-up
+            await client.request(method, path, **kwargs)
+        samples = []
+        for _ in range(n):
+            start = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            await response.aread()
+            samples.append((time.perf_counter() - start) * 1e6)
+            assert response.status_code == 200, response.text
+    return samples
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark gateway middleware overhead")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per case")
+    args = parser.parse_args()
+
+    # Isolate middleware cost: no 429s, no DB writes
+    rate_limiter.ROUTE_LIMITS = (("/bench", 10**9, 1),)
+    monitor._flush_traffic_to_db = lambda: None
+
+    cases = [
+        ("GET  json", "GET", "/bench", {}),
+        ("POST json", "POST", "/bench", {"json": {"page": "home", "note": "hello mentor"}}),
+        ("GET  sse", "GET", "/bench/stream", {}),
+    ]
+    apps = [("none", _base_app()), ("legacy", _legacy_app()), ("gateway", _gateway_app())]
+
+    print(f"{args.requests} sequential requests per case, in-process ASGI transport\n")
+    print(f"{'case':<10} {'stack':<8} {'median us':>10} {'p95 us':>8} {'overhead us':>12}")
+    for label, method, path, kwargs in cases:
+        baseline = None
+        for stack, app in apps:
+            samples = sorted(await _measure(app, method, path, args.requests, **kwargs))
+            median = statistics.median(samples)
+            p95 = samples[int(len(samples) * 0.95) - 1]
+            baseline = median if baseline is None else baseline
+            print(f"{label:<10} {stack:<8} {median:>10.1f} {p95:>8.1f} {median - baseline:>12.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+# FILE: scripts/bench_shared_state.py
+#
+# Worst-case latency of the SQLite shared-state backend under cross-worker
+# contention. N writer processes simulate busy uvicorn workers; the measured
+# process times what one request costs:
+#
+#   incr     - the old per-request path: take_token + 3 separate incr
+#              transactions (total, latency, histogram)
+#   add      - the current path: take_token + 3 buffered add() calls
+#
+#   cd mentormatch-backend
+#   python -m scripts.bench_shared_state --writers 4 --requests 3000
+#
+# Needs the usual .env (app settings are imported). Uses a throwaway file
+# under /dev/shm (or /tmp), never SHARED_STATE_PATH.
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from app.core.shared_state import SQLiteStateBackend
+
+
+def _writer(path: str, stop, worker: int):
+    state = SQLiteStateBackend(path)
+    i = 0
+    while not stop.is_set():
+        state.take_token(f"ratelimit:*:10.0.{worker}.{i % 200}", 10, 60)
+        state.incr("monitor:total_requests")
+        state.incr("monitor:total_latency_ms", 1.5)
+        state.incr(f"monitor:hist:{i % 60}", ttl_seconds=3660)
+        i += 1
+
+
+def _measure(state: SQLiteStateBackend, requests: int, buffered: bool) -> list:
+    timings = []
+    bump = state.add if buffered else state.incr
+    for i in range(requests):
+        start = time.perf_counter()
+        state.take_token(f"ratelimit:*:192.0.2.{i % 200}", 10, 60)
+        bump("monitor:total_requests")
+        bump("monitor:total_latency_ms", 1.5)
+        bump(f"monitor:hist:{i % 60}", ttl_seconds=3660)
+        timings.append((time.perf_counter() - start) * 1e6)
+    state.flush()
+    return timings
+
+
+def _report(label: str, timings: list):
+    timings = sorted(timings)
+    pct = lambda p: timings[min(len(timings) - 1, int(len(timings) * p))]
+    print(f"{label:<8} p50 {pct(0.50):8.0f}us   p99 {pct(0.99):8.0f}us   max {timings[-1]:8.0f}us"
+          f"   mean {statistics.fmean(timings):8.0f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite shared-state latency under contention")
+    parser.add_argument("--writers", type=int, default=4, help="competing worker processes")
+    parser.add_argument("--requests", type=int, default=3000, help="measured requests per mode")
+    args = parser.parse_args()
+
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    path = os.path.join(directory, f"bench-state-{os.getpid()}.db")
+    stop = multiprocessing.Event()
+    writers = [multiprocessing.Process(target=_writer, args=(path, stop, w)) for w in range(args.writers)]
+    try:
+        state = SQLiteStateBackend(path)
+        for proc in writers:
+            proc.start()
+        time.sleep(0.5)  # let the writers get going
+
+        print(f"{args.writers} competing writers, {args.requests} requests per mode")
+        _report("incr", _measure(state, args.requests, buffered=False))
+        _report("add", _measure(state, args.requests, buffered=True))
+    finally:
+        stop.set()
+        for proc in writers:
+            proc.join()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+# FILE: tests/conftest.py
+
+import os
+
+# Settings() needs these at import time; the unit tests never touch the real
+# services behind them.
+for _key, _value in {
+    "GOOGLE_CLIENT_ID": "test-client-id",
+    "SUPER_ADMIN_EMAIL": "admin@example.com",
+    "JWT_SECRET_KEY": "test-secret",
+    "POSTGRES_USER": "test",
+    "POSTGRES_PASSWORD": "test",
+    "POSTGRES_DB": "test",
+}.items():
+    os.environ.setdefault(_key, _value)
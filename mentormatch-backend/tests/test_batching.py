@@ -0,0 +1,99 @@
+# FILE: tests/test_batching.py
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app.core.batching import MicroBatcher
+
+
+def test_queue_depth_counters_settle_to_zero():
+    executor = ThreadPoolExecutor(max_workers=2)
+    batcher = MicroBatcher("echo", lambda items: items, max_batch_size=4, max_wait_ms=1, executor=executor)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(40)))
+
+    assert asyncio.run(scenario()) == list(range(40))
+    stats = batcher.stats()
+    assert (stats["queued_batches"], stats["running_batches"]) == (0, 0)
+    executor.shutdown()
+
+
+def test_batch_that_never_started_does_not_skew_counters():
+    executor = ThreadPoolExecutor(max_workers=1)
+    executor.shutdown()
+    batcher = MicroBatcher("closed", lambda items: items, max_batch_size=1, max_wait_ms=1, executor=executor)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(batcher.submit("x"))
+    stats = batcher.stats()
+    assert (stats["queued_batches"], stats["running_batches"], stats["errors"]) == (0, 0, 1)
+
+
+def test_concurrent_submits_share_a_batch_and_get_their_own_result():
+    calls = []
+
+    def run_batch(items):
+        calls.append(list(items))
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher("times_ten", run_batch, max_batch_size=8, max_wait_ms=20)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    assert asyncio.run(scenario()) == [0, 10, 20, 30, 40]
+    assert calls == [[0, 1, 2, 3, 4]]
+    assert batcher.stats()["avg_batch_size"] == 5
+
+
+def test_full_batch_flushes_without_waiting_for_the_timer():
+    calls = []
+    batcher = MicroBatcher("sizes", lambda items: calls.append(len(items)) or items,
+                           max_batch_size=3, max_wait_ms=10_000)
+
+    async def scenario():
+        return await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(6))), 2)
+
+    assert asyncio.run(scenario()) == list(range(6))
+    assert calls == [3, 3]
+
+
+def test_batch_error_reaches_every_caller_in_that_batch():
+    def run_batch(items):
+        raise ValueError("model crashed")
+
+    batcher = MicroBatcher("broken", run_batch, max_batch_size=8, max_wait_ms=5)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert batcher.stats()["errors"] == 1
+
+
+def test_max_in_flight_keeps_one_batch_per_model_running():
+    import threading, time
+    lock, running, peak = threading.Lock(), [0], [0]
+
+    def run_batch(items):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return items
+
+    executor = ThreadPoolExecutor(max_workers=4)
+    batcher = MicroBatcher("serial", run_batch, max_batch_size=2, max_wait_ms=1,
+                           executor=executor, max_in_flight=1)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(12)))
+
+    assert asyncio.run(scenario()) == list(range(12))
+    assert peak[0] == 1
+    assert batcher.stats()["pending_items"] == 0
+    executor.shutdown()
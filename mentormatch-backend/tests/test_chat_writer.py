@@ -0,0 +1,77 @@
+# FILE: tests/test_chat_writer.py
+
+import asyncio
+import pytest
+from app.services import chat_writer as chat_writer_module
+from app.services.chat_writer import ChatWriteBehind
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    monkeypatch.setattr(chat_writer_module, "_RETRY_DELAY_SECONDS", 0)
+    writer = ChatWriteBehind()
+    writer.committed = []
+
+    def insert(batch):
+        # Any batch holding the poisoned session fails as a whole
+        if any(row.get("id") == "bad" for _, rows in batch for row in rows):
+            raise RuntimeError("duplicate key")
+        writer.committed.extend(batch)
+
+    monkeypatch.setattr(writer, "_insert", insert)
+    return writer
+
+
+def test_failed_batch_is_split_and_only_the_bad_item_is_lost(writer):
+    batch = [
+        ("session", [{"id": "good"}]),
+        ("session", [{"id": "bad"}]),
+        ("messages", [{"session_id": "good", "content": "hi"}]),
+    ]
+    lost = writer._flush(batch)
+
+    assert lost == ["bad"]
+    assert writer.committed == [batch[0], batch[2]]
+    assert writer.dropped_rows == 1
+
+
+def test_session_stays_pending_until_its_flush_finishes(writer, monkeypatch):
+    forgotten = []
+    from app.services.chatvat import chatvat_service
+    monkeypatch.setattr(chatvat_service, "forget_session", forgotten.append)
+
+    async def scenario():
+        writer._queue = asyncio.Queue()
+        writer._task = asyncio.get_running_loop().create_future()  # "running", no flusher
+        assert writer.enqueue_session("good", "1.2.3.4")
+        assert writer.enqueue_session("bad", "1.2.3.4")
+        assert writer.is_pending_session("good") and writer.is_pending_session("bad")
+
+        batch = [writer._queue.get_nowait(), writer._queue.get_nowait()]
+        await writer._flush_batch(batch)
+
+    asyncio.run(scenario())
+    assert not writer.is_pending_session("good")
+    assert not writer.is_pending_session("bad")
+    assert forgotten == ["bad"]
+
+
+def test_stats_report_written_and_dropped_rows(writer):
+    writer._flush([("session", [{"id": "good"}]), ("messages", [{"session_id": "good"}, {"session_id": "good"}])])
+    writer._flush([("session", [{"id": "bad"}])])
+
+    stats = writer.stats()
+    assert (stats["written_rows"], stats["dropped_rows"], stats["queued"]) == (3, 1, 0)
+
+
+def test_write_behind_stays_off_with_several_workers(monkeypatch):
+    monkeypatch.setattr(chat_writer_module.settings, "CHAT_WRITE_BEHIND_ENABLED", True)
+    monkeypatch.setattr(chat_writer_module.settings, "SHARED_STATE_BACKEND", "sqlite")
+    writer = ChatWriteBehind()
+
+    async def scenario():
+        writer.start()
+        return writer.running, writer.enqueue_session("s1", "1.2.3.4")
+
+    assert asyncio.run(scenario()) == (False, False)
+    assert not writer.is_pending_session("s1")
@@ -0,0 +1,32 @@
+# FILE: tests/test_chatvat.py
+
+import asyncio
+import httpx
+import pytest
+from app.services.chatvat import ChatVatService
+
+
+def _service(body: bytes, content_type: str = "application/json") -> ChatVatService:
+    service = ChatVatService()
+    transport = httpx.MockTransport(
+        lambda request: httpx.Response(200, content=body, headers={"content-type": content_type})
+    )
+    service._client = httpx.AsyncClient(transport=transport)
+    return service
+
+
+def test_json_reply_is_returned():
+    service = _service(b'{"message": "Hello!"}')
+    assert asyncio.run(service._send_with_retry({"message": "hi"})) == "Hello!"
+
+
+def test_non_json_200_counts_as_an_upstream_failure(monkeypatch):
+    service = _service(b"<html>Bad gateway</html>", content_type="text/html")
+    monkeypatch.setattr(service, "_backoff", lambda attempt: 0)
+
+    with pytest.raises(httpx.DecodingError):
+        asyncio.run(service._send_with_retry({"message": "hi"}))
+
+    backends = service._pool.backends
+    assert sum(b.total_errors for b in backends) >= 1
+    assert all(b.last_error for b in backends if b.total_errors)
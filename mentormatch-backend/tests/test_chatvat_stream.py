@@ -0,0 +1,31 @@
+# FILE: tests/test_chatvat_stream.py
+
+import asyncio
+import httpx
+import pytest
+from app.services.chatvat import ChatVatService
+
+
+def _service(body: bytes) -> ChatVatService:
+    service = ChatVatService()
+    transport = httpx.MockTransport(
+        lambda request: httpx.Response(200, content=body, headers={"content-type": "application/json"})
+    )
+    service._client = httpx.AsyncClient(transport=transport)
+    return service
+
+
+def _collect(service: ChatVatService) -> list:
+    async def run():
+        return [chunk async for chunk in service._read_stream("http://chatvat/chat/stream", {"message": "hi"}, 5)]
+    return asyncio.run(run())
+
+
+def test_json_fallback_yields_one_chunk():
+    assert _collect(_service(b'{"message": "Hello!"}')) == ["Hello!"]
+
+
+@pytest.mark.parametrize("body", [b"<html>502</html>", b'["not", "an", "object"]'])
+def test_malformed_json_fallback_is_an_upstream_error(body):
+    with pytest.raises(httpx.DecodingError):
+        _collect(_service(body))
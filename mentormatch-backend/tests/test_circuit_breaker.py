@@ -0,0 +1,86 @@
+# FILE: tests/test_circuit_breaker.py
+
+import pytest
+from app.services import circuit_breaker
+from app.services.circuit_breaker import CircuitBreaker, RetryBudget
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(circuit_breaker, "time", clock)
+    return clock
+
+
+def _tripped(clock) -> CircuitBreaker:
+    breaker = CircuitBreaker("chatvat", failure_threshold=3, reset_timeout_seconds=30)
+    for _ in range(2):
+        assert breaker.record_failure() is False
+    assert breaker.record_failure() is True
+    return breaker
+
+
+def test_opens_after_threshold_and_fails_fast(clock):
+    breaker = _tripped(clock)
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow_request() is False
+    assert breaker.retry_after() == 30
+
+
+def test_half_open_lets_exactly_one_probe_through(clock):
+    breaker = _tripped(clock)
+    clock.now += 30
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request() is True
+    assert breaker.allow_request() is False
+    assert breaker.allow_request() is False
+
+
+def test_successful_probe_closes_the_circuit(clock):
+    breaker = _tripped(clock)
+    clock.now += 30
+    breaker.allow_request()
+
+    assert breaker.record_success() is True
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request() is True
+
+
+def test_failed_probe_reopens_for_a_full_timeout(clock):
+    breaker = _tripped(clock)
+    clock.now += 30
+    breaker.allow_request()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 29
+    assert breaker.allow_request() is False
+
+
+def test_lost_probe_is_replaced_after_the_timeout(clock):
+    breaker = _tripped(clock)
+    clock.now += 30
+    assert breaker.allow_request() is True   # probe never reports back
+    clock.now += 30
+    assert breaker.allow_request() is True
+
+
+def test_retry_budget_is_a_fraction_of_traffic():
+    budget = RetryBudget(ratio=0.5, min_tokens=2)
+    assert budget.try_spend() and budget.try_spend()
+    assert budget.try_spend() is False
+
+    budget.deposit()
+    budget.deposit()
+    assert budget.try_spend() is True
+    assert budget.try_spend() is False
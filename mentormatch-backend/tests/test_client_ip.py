@@ -0,0 +1,63 @@
+# FILE: tests/test_client_ip.py
+
+import pytest
+from pydantic import ValidationError
+from starlette.requests import Request
+from app.core.client_ip import get_client_ip
+from app.schemas.admin import IPBanRequest
+
+
+def _request(peer, forwarded=None):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 40000)})
+
+
+def test_direct_peer_is_the_client_and_its_header_is_ignored():
+    assert get_client_ip(_request("203.0.113.7", "1.1.1.1")) == "203.0.113.7"
+
+
+def test_trusted_proxy_forwards_the_client_address():
+    assert get_client_ip(_request("172.17.0.1", "203.0.113.7")) == "203.0.113.7"
+
+
+def test_forged_left_entries_are_ignored():
+    # Client sent "X-Forwarded-For: 1.1.1.1"; Nginx appended the real address
+    assert get_client_ip(_request("172.17.0.1", "1.1.1.1, 203.0.113.7")) == "203.0.113.7"
+
+
+def test_trusted_hops_are_skipped():
+    assert get_client_ip(_request("127.0.0.1", "203.0.113.7, 172.18.0.5")) == "203.0.113.7"
+
+
+def test_proxy_without_header_or_with_garbage_falls_back_to_last_good_hop():
+    assert get_client_ip(_request("172.17.0.1")) == "172.17.0.1"
+    assert get_client_ip(_request("172.17.0.1", "not-an-ip")) == "172.17.0.1"
+
+
+def test_every_spelling_of_an_address_is_one_key():
+    assert get_client_ip(_request("2001:DB8::0001")) == "2001:db8::1"
+    assert get_client_ip(_request("::ffff:203.0.113.7")) == "203.0.113.7"
+    assert get_client_ip(_request("172.17.0.1", "2001:db8:0:0::0001")) == "2001:db8::1"
+
+
+def test_ban_request_ip_is_validated_and_normalized():
+    assert IPBanRequest(ip=" ::0001 ").ip == "::1"
+    with pytest.raises(ValidationError):
+        IPBanRequest(ip="10.0.0.1; DROP TABLE")
+
+
+def test_unban_normalizes_the_path_address(monkeypatch):
+    from fastapi import HTTPException
+    from types import SimpleNamespace
+    from app.api.endpoints import admin
+
+    unbanned = []
+    monkeypatch.setattr(admin.jail, "unban", lambda ip: unbanned.append(ip) or True)
+    monkeypatch.setattr(admin.monitor, "log_security_event", lambda *args, **kwargs: None)
+    user = SimpleNamespace(email="admin@example.com")
+
+    admin.unban_ip("2001:DB8::0001", user=user)
+    assert unbanned == ["2001:db8::1"]
+    with pytest.raises(HTTPException) as exc:
+        admin.unban_ip("not-an-ip", user=user)
+    assert exc.value.status_code == 422
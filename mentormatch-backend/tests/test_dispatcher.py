@@ -0,0 +1,119 @@
+# FILE: tests/test_dispatcher.py
+
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.services.dispatcher import FairDispatcher
+
+
+def test_freed_slots_go_round_robin_across_clients():
+    dispatcher = FairDispatcher(max_concurrency=1, max_queue=10, max_wait_seconds=5)
+    order = []
+
+    async def call(key: tuple, tag: str, hold: asyncio.Event = None):
+        async with dispatcher.slot(key):
+            order.append(tag)
+            if hold is not None:
+                await hold.wait()
+
+    async def scenario():
+        hold = asyncio.Event()
+        first = asyncio.create_task(call(("noisy", "tab"), "noisy-0", hold))
+        await asyncio.sleep(0)
+        # The noisy client queues three requests before the quiet one arrives
+        tasks = [asyncio.create_task(call(("noisy", "tab"), f"noisy-{i}")) for i in (1, 2, 3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call(("quiet", "tab"), "quiet-0")))
+        await asyncio.sleep(0)
+        hold.set()
+        await asyncio.gather(first, *tasks)
+
+    asyncio.run(scenario())
+    assert order == ["noisy-0", "noisy-1", "quiet-0", "noisy-2", "noisy-3"]
+    assert dispatcher.stats()["active"] == 0
+
+
+
+def test_sessions_behind_one_ip_take_turns():
+    # A campus NAT: many students, one IP. A busy session there must not
+    # starve its neighbours, nor crowd out other IPs.
+    dispatcher = FairDispatcher(max_concurrency=1, max_queue=10, max_wait_seconds=5)
+    order = []
+
+    async def call(key: tuple, tag: str, hold: asyncio.Event = None):
+        async with dispatcher.slot(key):
+            order.append(tag)
+            if hold is not None:
+                await hold.wait()
+
+    async def scenario():
+        hold = asyncio.Event()
+        first = asyncio.create_task(call(("nat", "busy"), "busy-0", hold))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(call(("nat", "busy"), f"busy-{i}")) for i in (1, 2, 3)]
+        tasks.append(asyncio.create_task(call(("nat", "quiet"), "quiet-0")))
+        tasks.append(asyncio.create_task(call(("home", "solo"), "solo-0")))
+        await asyncio.sleep(0)
+        assert (dispatcher.stats()["queued_clients"], dispatcher.stats()["queued_sessions"]) == (2, 3)
+        hold.set()
+        await asyncio.gather(first, *tasks)
+
+    asyncio.run(scenario())
+    assert order == ["busy-0", "busy-1", "solo-0", "quiet-0", "busy-2", "busy-3"]
+    assert dispatcher.stats()["queued"] == 0
+
+def test_full_queue_rejects_immediately_with_503():
+    dispatcher = FairDispatcher(max_concurrency=1, max_queue=1, max_wait_seconds=5)
+
+    async def scenario():
+        hold = asyncio.Event()
+
+        async def holder():
+            async with dispatcher.slot(("a", "s")):
+                await hold.wait()
+
+        async def waiter():
+            async with dispatcher.slot(("b", "s")):
+                pass
+
+        running = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+
+        with pytest.raises(HTTPException) as exc:
+            async with dispatcher.slot(("c", "s")):
+                pass
+        hold.set()
+        await asyncio.gather(running, queued)
+        return exc.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert dispatcher.stats() == {"active": 0, "max_concurrency": 1, "queued": 0, "queued_clients": 0,
+                                  "queued_sessions": 0, "rejected": 1}
+
+
+def test_wait_longer_than_max_wait_gives_503_and_leaves_queue_clean():
+    dispatcher = FairDispatcher(max_concurrency=1, max_queue=10, max_wait_seconds=5)
+
+    async def scenario():
+        hold = asyncio.Event()
+
+        async def holder():
+            async with dispatcher.slot(("a", "s")):
+                await hold.wait()
+
+        running = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException):
+            async with dispatcher.slot(("b", "s"), max_wait=0.01):
+                pass
+        stats = dispatcher.stats()
+        hold.set()
+        await running
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert (stats["active"], stats["queued"], stats["queued_clients"]) == (1, 0, 0)
+    assert dispatcher.stats()["active"] == 0
@@ -0,0 +1,57 @@
+# FILE: tests/test_gateway.py
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from app.middleware import gateway
+from app.middleware.gateway import GatewayMiddleware
+
+
+@pytest.fixture
+def logged(monkeypatch):
+    calls = []
+    monkeypatch.setattr(gateway.monitor, "log_request",
+                        lambda latency_ms, route, status_code: calls.append((route, status_code)))
+    return calls
+
+
+@pytest.fixture
+def client():
+    public, admin = APIRouter(), APIRouter()
+
+    @public.get("/feedback")
+    def public_feedback():
+        return {}
+
+    @admin.get("/feedback")
+    def admin_feedback():
+        return {}
+
+    @admin.post("/jail/{ip}/unban")
+    def unban(ip: str):
+        return {}
+
+    app = FastAPI()
+    app.include_router(public, prefix="/api/v1")
+    app.include_router(admin, prefix="/api/v1/admin")
+    app.add_middleware(GatewayMiddleware)
+    return TestClient(app)
+
+
+def test_route_labels_keep_router_prefix_and_method(client, logged):
+    client.get("/api/v1/feedback")
+    client.get("/api/v1/admin/feedback")
+    client.post("/api/v1/admin/jail/10.0.0.1/unban")
+
+    assert logged == [
+        ("GET /api/v1/feedback", 200),
+        ("GET /api/v1/admin/feedback", 200),
+        ("POST /api/v1/admin/jail/{ip}/unban", 200),
+    ]
+
+
+def test_unknown_paths_share_one_label(client, logged):
+    client.get("/api/v1/admin/nope/1")
+    client.get("/api/v1/admin/nope/2")
+
+    assert logged == [("unmatched", 404), ("unmatched", 404)]
@@ -0,0 +1,61 @@
+# FILE: tests/test_jail.py
+
+import time
+import pytest
+from app.core import jail as jail_module, monitor as monitor_module
+from app.core.jail import IPJail
+from app.core.shared_state import MemoryStateBackend, SQLiteStateBackend
+
+
+@pytest.fixture
+def state(monkeypatch, tmp_path):
+    state = SQLiteStateBackend(str(tmp_path / "state.db"))
+    monkeypatch.setattr(jail_module, "shared_state", state)
+    return state
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_strikes_past_the_threshold_earn_a_ban(state):
+    jail = IPJail()
+    results = [jail.record_offence("SQLI", "203.0.113.7") for _ in range(2)]  # 5 + 5 points
+
+    assert results[0] is None and results[1] > 0
+    assert jail.is_banned("203.0.113.7") > 0
+
+
+def test_queued_offences_are_summed_and_ban_once(state):
+    jail = IPJail()
+    bans = []
+    for _ in range(30):
+        jail.queue_offence("RATE_LIMIT", "203.0.113.7", lambda ip, seconds: bans.append(ip))
+
+    assert _wait_for(lambda: jail.is_banned("203.0.113.7") > 0)
+    assert _wait_for(lambda: bans == ["203.0.113.7"])
+
+
+def test_blocking_backend_keeps_strikes_off_the_caller(monkeypatch, state):
+    monkeypatch.setattr(monitor_module, "shared_state", state)
+    queued = []
+    monkeypatch.setattr(monitor_module.jail, "record_offence",
+                        lambda *args: pytest.fail("strike written on the caller's thread"))
+    monkeypatch.setattr(monitor_module.jail, "queue_offence", lambda event_type, ip, on_ban: queued.append(ip))
+    monkeypatch.setattr(monitor_module.monitor_writer, "submit_event", lambda *args: True)
+
+    monitor_module.monitor.log_security_event("SQLI", "test", client_ip="203.0.113.7")
+    assert queued == ["203.0.113.7"]
+
+
+def test_memory_backend_records_inline(monkeypatch):
+    monkeypatch.setattr(monitor_module, "shared_state", MemoryStateBackend())
+    recorded = []
+    monkeypatch.setattr(monitor_module.jail, "record_offence", lambda event_type, ip: recorded.append(ip))
+    monkeypatch.setattr(monitor_module.monitor_writer, "submit_event", lambda *args: True)
+
+    monitor_module.monitor.log_security_event("SQLI", "test", client_ip="203.0.113.7")
+    assert recorded == ["203.0.113.7"]
@@ -0,0 +1,38 @@
+# FILE: tests/test_prompt_guard.py
+
+from app.middleware import prompt_guard
+
+
+class _ScanOnly:
+    """A scanner exposing only llm_guard's public scan()."""
+
+    def __init__(self, verdicts):
+        self.verdicts = verdicts
+        self.seen = []
+
+    def scan(self, prompt):
+        self.seen.append(prompt)
+        valid, score = self.verdicts[prompt]
+        return prompt, valid, score
+
+
+class _Batchable:
+    _pipeline = _threshold = _classifier = _topics = object()
+
+
+def test_missing_internals_disable_batched_inference():
+    assert prompt_guard._supports_batching(_Batchable(), _Batchable())
+    assert not prompt_guard._supports_batching(_ScanOnly({}), _Batchable())
+    assert not prompt_guard._supports_batching(_Batchable(), _ScanOnly({}))
+
+
+def test_batches_fall_back_to_per_prompt_scan(monkeypatch):
+    injection = _ScanOnly({"hi": (True, -1.0), "ignore that": (False, 0.9)})
+    topics = _ScanOnly({"hi": (True, -1.0), "ignore that": (True, 0.1)})
+    monkeypatch.setattr(prompt_guard, "injection_scanner", injection)
+    monkeypatch.setattr(prompt_guard, "topic_scanner", topics)
+    monkeypatch.setattr(prompt_guard, "_batched_inference", False)
+
+    assert prompt_guard._injection_batch(["hi", "ignore that"]) == [(True, -1.0), (False, 0.9)]
+    assert prompt_guard._topic_batch(["hi", "ignore that"]) == [(True, -1.0), (True, 0.1)]
+    assert injection.seen == topics.seen == ["hi", "ignore that"]
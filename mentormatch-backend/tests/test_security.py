@@ -0,0 +1,45 @@
+# FILE: tests/test_security.py
+
+import asyncio
+import pytest
+from starlette.requests import Request
+from app.middleware import security
+from app.middleware.security import MAX_EXEMPT_BODY_SIZE, check_input
+
+
+def _post(path: str, body: bytes) -> Request:
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": [], "client": ("203.0.113.7", 1)}
+    return Request(scope, receive)
+
+
+@pytest.fixture
+def events(monkeypatch):
+    logged = []
+    monkeypatch.setattr(security.monitor, "log_security_event",
+                        lambda event_type, detail, client_ip=None: logged.append(event_type))
+    return logged
+
+
+def test_long_chat_paste_is_413_without_an_sqli_strike(events):
+    response = asyncio.run(check_input(_post("/api/v1/chat", b"x" * (MAX_EXEMPT_BODY_SIZE + 1))))
+
+    assert response.status_code == 413
+    assert events == ["OVERSIZED_PAYLOAD"]
+
+
+def test_sqli_pattern_on_scanned_route(events):
+    response = asyncio.run(check_input(_post("/api/v1/visit", b"' OR '1'='1")))
+
+    assert response.status_code == 400
+    assert events == ["SQLI"]
+
+
+def test_chat_body_is_kept_for_replay(events):
+    request = _post("/api/v1/chat", b'{"message": "select a mentor"}')
+
+    assert asyncio.run(check_input(request)) is None
+    assert request._body == b'{"message": "select a mentor"}'
+    assert events == []
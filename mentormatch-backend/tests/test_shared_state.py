@@ -0,0 +1,80 @@
+# FILE: tests/test_shared_state.py
+
+import pytest
+from app.core.shared_state import MemoryStateBackend, SharedStateBackend, SQLiteStateBackend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStateBackend()
+    return SQLiteStateBackend(str(tmp_path / "state.db"))
+
+
+def test_interface_is_abstract():
+    with pytest.raises(TypeError):
+        SharedStateBackend()
+
+
+def test_buffered_adds_land_after_flush(backend):
+    for _ in range(100):
+        backend.add("hits")
+    backend.add("latency", 2.5)
+    backend.add("latency", 2.5)
+    backend.flush()
+
+    assert backend.get("hits") == 100
+    assert backend.get("latency") == 5.0
+
+
+def test_sqlite_adds_are_shared_between_handles(tmp_path):
+    path = str(tmp_path / "state.db")
+    worker_a, worker_b = SQLiteStateBackend(path), SQLiteStateBackend(path)
+    worker_a.add("hits", 3)
+    worker_b.add("hits", 4)
+    worker_a.flush()
+    worker_b.flush()
+
+    assert worker_a.get("hits") == worker_b.get("hits") == 7
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    from app.core import shared_state
+    clock = _Clock()
+    monkeypatch.setattr(shared_state, "time", clock)
+    return clock
+
+
+def test_take_token_allows_a_burst_then_refills_at_the_rate(backend, clock):
+    # 10 per 60s: burst of 10, then one token every 6s
+    assert [backend.take_token("ip", 10, 60) for _ in range(10)] == [0.0] * 10
+    assert backend.take_token("ip", 10, 60) == pytest.approx(6.0)
+
+    clock.now += 3
+    assert backend.take_token("ip", 10, 60) == pytest.approx(3.0)
+    clock.now += 3
+    assert backend.take_token("ip", 10, 60) == 0.0
+    assert backend.take_token("ip", 10, 60) > 0
+
+
+def test_take_token_refill_is_capped_at_capacity(backend, clock):
+    backend.take_token("ip", 2, 60)
+    clock.now += 3600
+
+    assert [backend.take_token("ip", 2, 60) for _ in range(2)] == [0.0, 0.0]
+    assert backend.take_token("ip", 2, 60) > 0
+
+
+def test_buckets_are_per_key(backend, clock):
+    backend.take_token("a", 1, 60)
+    assert backend.take_token("a", 1, 60) > 0
+    assert backend.take_token("b", 1, 60) == 0.0
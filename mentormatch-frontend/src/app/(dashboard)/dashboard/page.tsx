@@ -299,6 +299,24 @@ export default function DashboardOverviewPage() {
         </Card>
       </motion.div>
 
+      {/* Cache Hit Rates */}
+      {Object.keys(data.caches ?? {}).length > 0 && (
+        <motion.section variants={fadeUp}>
+          <h2 className="text-sm font-medium text-muted-foreground uppercase tracking-wider mb-4">
+            Cache Hit Rates
+          </h2>
+          <div className="grid grid-cols-2 lg:grid-cols-4 gap-4">
+            {Object.entries(data.caches).map(([name, cache]) => (
+              <MiniStat
+                key={name}
+                label={`${name} (${cache.hits}/${cache.hits + cache.misses})`}
+                value={`${cache.hit_rate.toFixed(1)}%`}
+              />
+            ))}
+          </div>
+        </motion.section>
+      )}
+
       {/* Top Processes */}
       {data.system.top_processes.length > 0 && (
         <motion.section variants={fadeUp}>
@@ -26,6 +26,9 @@ export interface TrafficStats {
   requests_per_minute_peak: number;
   average_latency_ms: number;
   total_tokens_processed: number;
+  latency_p50_ms: number;
+  latency_p95_ms: number;
+  latency_p99_ms: number;
 }
 
 export interface TrafficHistoryPoint {
@@ -61,6 +64,12 @@ export interface ProcessInfo {
   memory_percent: number;
 }
 
+export interface CacheStats {
+  hits: number;
+  misses: number;
+  hit_rate: number;   // Percentage of lookups served from cache
+}
+
 export interface SystemHealth {
   cpu_usage_percent: number;
   ram_usage_percent: number;
@@ -90,6 +99,7 @@ export interface SuperAdminDashboard {
   security: SecurityStats;
   system: SystemHealth;
   business: BusinessStats;
+  caches: Record<string, CacheStats>;   // Answer, history and verdict caches
   recent_security_logs: string[];
 }
 